@@ -0,0 +1,146 @@
+# Микробенчмарк разбора быстрых заметок на сгенерированном корпусе.
+# Для каждого сообщения корпуса заодно проверяются свойства результата:
+# время корректно, дата в формате ГГГГ-ММ-ДД, заголовок не пуст и совпадает
+# с заданным, указанные время/дата/напоминание распознаны.
+#
+#   python benchmarks/bench_parser.py --messages 20000
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from note_parser import parse_message
+
+# Заголовки, оканчивающиеся на "в"/"за", и числа с единицами внутри заголовка
+# проверяют, что предлоги времени и напоминания ищутся только целыми словами
+TITLES = ['Забрать детей', 'Врач', 'Футбол', 'Купить продукты', 'Родительское собрание',
+          'День рождения бабушки', 'Оплатить интернет', 'Прививка кошке', 'Ужин у родителей',
+          'Позвонить Иванов', 'Заказать плов', 'Встретить Лиза', 'Лиза 2 часа уроки',
+          'Проверить глаза', 'Ремонт 3 дня']
+RELATIVE = {'сегодня': 0, 'завтра': 1, 'послезавтра': 2}
+WEEKDAYS = ['понедельник', 'вторник', 'среду', 'четверг', 'пятницу', 'субботу', 'воскресенье']
+MONTHS = ['января', 'февраля', 'марта', 'апреля', 'мая', 'июня',
+          'июля', 'августа', 'сентября', 'октября', 'ноября', 'декабря']
+RRULE_DAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+RECURRENCE = {'ежедневно': 'FREQ=DAILY', 'каждую неделю': 'FREQ=WEEKLY', 'каждый месяц': 'FREQ=MONTHLY'}
+
+
+def generate_date(rnd, today, kinds):
+    # Возвращает (текст даты или None, дата)
+    kind = rnd.choice(kinds)
+    if kind == 'relative':
+        word = rnd.choice(list(RELATIVE))
+        return word, today + timedelta(days=RELATIVE[word])
+    if kind == 'weekday':
+        weekday = rnd.randrange(7)
+        preposition = 'во' if weekday == 1 else 'в'
+        return f"{preposition} {WEEKDAYS[weekday]}", today + timedelta(days=(weekday - today.weekday()) % 7 or 7)
+    day = today + timedelta(days=rnd.randint(0, 300))
+    if kind == 'numeric':
+        return f"{day.day:02d}.{day.month:02d}", day
+    if kind == 'text':
+        return f"{day.day} {MONTHS[day.month - 1]}", day
+    return None, today
+
+
+def generate_line(rnd, today, default_date, dated=True):
+    # Возвращает (строка, ожидание); без dated дата берется из заголовка сообщения
+    title = rnd.choice(TITLES)
+    hours, minutes = rnd.randint(0, 23), rnd.randint(0, 59)
+    expected = {'title': title, 'note_time': f"{hours:02d}:{minutes:02d}", 'note_date': default_date,
+                'end_time': None, 'reminder_minutes': None, 'recurrence': None}
+    parts = [title, f"{rnd.choice(['', 'в '])}{hours}:{minutes:02d}"]
+
+    text = None
+    if dated:
+        text, day = generate_date(rnd, today, ['none', 'relative', 'weekday', 'numeric', 'text'])
+        if text:
+            parts.insert(0, text)
+            expected['note_date'] = day
+
+    if rnd.random() < 0.3:
+        end = f"{min(hours + 1, 23):02d}:{minutes:02d}"
+        parts[-1] += f"-{end}"
+        expected['end_time'] = end
+    if rnd.random() < 0.3:
+        reminder, unit, factor = rnd.choice([(5, 'минут', 1), (15, 'минут', 1), (2, 'часа', 60), (1, 'день', 1440)])
+        parts.append(f"напомнить за {reminder} {unit}")
+        expected['reminder_minutes'] = reminder * factor
+    if rnd.random() < 0.2:
+        if rnd.random() < 0.5:
+            word = rnd.choice(list(RECURRENCE))
+            expected['recurrence'] = RECURRENCE[word]
+        else:
+            weekday = rnd.randrange(7)
+            word = f"{'каждое' if weekday == 6 else 'каждую' if weekday in (2, 4, 5) else 'каждый'} {WEEKDAYS[weekday]}"
+            expected['recurrence'] = f"FREQ=WEEKLY;BYDAY={RRULE_DAYS[weekday]}"
+            # Без явной даты серия начинается с ближайшего такого дня
+            if not text:
+                base = expected['note_date']
+                expected['note_date'] = base + timedelta(days=(weekday - base.weekday()) % 7)
+        parts.append(word)
+
+    expected['note_date'] = expected['note_date'].strftime('%Y-%m-%d')
+    return ' '.join(parts), expected
+
+
+def generate(rnd, today):
+    # Возвращает (сообщение, ожидания): одна строка или несколько строк
+    # под заголовком с датой ("завтра:")
+    if rnd.random() < 0.8:
+        line, expected = generate_line(rnd, today, today)
+        return line, [expected]
+    header, day = generate_date(rnd, today, ['relative', 'weekday', 'numeric', 'text'])
+    lines = [generate_line(rnd, today, day, dated=False) for _ in range(rnd.randint(1, 4))]
+    return '\n'.join([f"{header}:"] + [line for line, _ in lines]), [expected for _, expected in lines]
+
+
+def check(message, expected, notes, errors):
+    assert not errors and len(notes) == len(expected), (message, notes, errors)
+    for note, wanted in zip(notes, expected):
+        for key, value in wanted.items():
+            assert note[key] == value, (message, key, note[key], value)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    today = date.today()
+    corpus = [generate(rnd, today) for _ in range(args.messages)]
+
+    for message, expected in corpus:
+        check(message, expected, *parse_message(message, today))
+    # Срок напоминания больше недели - ошибка строки, а не заметка
+    for message in ('Созвон 10:00 напомнить за 1000000 дней', 'Созвон 10:00 за 8 дней'):
+        notes, errors = parse_message(message, today)
+        assert not notes and errors == [message], (message, notes, errors)
+
+    started = time.perf_counter()
+    for message, _ in corpus:
+        parse_message(message, today)
+    single = (time.perf_counter() - started) / len(corpus) * 1e6
+
+    # Пачка - 20 сообщений корпуса одним текстом; в сообщениях с
+    # заголовком несколько строк, поэтому время делится на число строк
+    batch = '\n'.join(message for message, _ in corpus[:20])
+    lines = batch.count('\n') + 1
+    started = time.perf_counter()
+    for _ in range(1000):
+        parse_message(batch, today)
+    multi = (time.perf_counter() - started) / 1000 * 1e6
+
+    print(f"корпус: {len(corpus)} сообщений, все проверки пройдены")
+    print(f"сообщение корпуса: {single:.1f} мкс/сообщение")
+    print(f"пачка из 20 сообщений (строк: {lines}): {multi:.1f} мкс/пачку, {multi / lines:.1f} мкс/строку")
+
+
+if __name__ == '__main__':
+    main()
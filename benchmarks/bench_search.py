@@ -0,0 +1,87 @@
+# Сравнение поиска по заметкам: LIKE '%...%' против FTS5 (Database.search_notes).
+#
+#   python benchmarks/bench_search.py --sizes 10000,100000,1000000 --per-family 1000
+#
+# LIKE просматривает все заметки семьи, FTS - только совпадения, поэтому
+# выигрыш растет с числом заметок в семье (--per-family).
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+WORDS = (
+    'забрать детей школа садик кружок бассейн футбол музыка врач стоматолог '
+    'купить молоко хлеб продукты подарок бабушка дедушка день рождения ужин '
+    'обед завтрак встреча работа отчет собрание родительское оплатить квартира '
+    'интернет машина сервис шиномонтаж прививка ветеринар кошка собака прогулка '
+    'парк кино театр концерт билеты поезд самолет отпуск дача уборка ремонт'
+).split()
+
+QUERIES = ['стоматолог', 'забр дет', 'билеты театр', 'ветеринар кошка']
+
+
+def fill(db, size, families):
+    rnd = random.Random(size)
+    with db.transaction():
+        for i in range(families):
+            db.create_family(f"S{i:07d}", f"Семья {i}")
+    chunk = 10000
+    for start in range(0, size, chunk):
+        db.add_notes([
+            {
+                'user_id': None,
+                'family_id': rnd.randint(1, families),
+                'title': ' '.join(rnd.choices(WORDS, k=3)).capitalize(),
+                'content': ' '.join(rnd.choices(WORDS, k=8)),
+                'note_date': f"2026-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+                'note_time': f"{rnd.randint(0, 23):02d}:00",
+                'color_tag': '#4CAF50',
+            }
+            for _ in range(min(chunk, size - start))
+        ])
+
+
+def search_like(db, family_id, text):
+    return db._fetchall('''
+        SELECT n.*, u.full_name as author_name, u.avatar_color
+        FROM notes n LEFT JOIN users u ON n.user_id = u.user_id
+        WHERE n.family_id = ?
+        AND (n.title LIKE ? OR n.content LIKE ?)
+        ORDER BY n.note_date, n.note_time
+    ''', (family_id, f'%{text}%', f'%{text}%'))
+
+
+def measure(fn, families, repeat):
+    rnd = random.Random(0)
+    started = time.perf_counter()
+    for i in range(repeat):
+        fn(rnd.randint(1, families), QUERIES[i % len(QUERIES)])
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--per-family', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    for size in [int(s) for s in args.sizes.split(',')]:
+        families = max(size // args.per_family, 1)
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Database(os.path.join(tmp, 'bench.db'))
+            fill(db, size, families)
+            like_ms = measure(lambda f, q: search_like(db, f, q.split()[0]), families, args.repeat)
+            fts_ms = measure(lambda f, q: db.search_notes(f, q), families, args.repeat)
+            print(f"{size:>8} заметок: LIKE {like_ms:.3f} мс, FTS {fts_ms:.3f} мс")
+            db.close()
+
+
+if __name__ == '__main__':
+    main()
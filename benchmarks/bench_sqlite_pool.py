@@ -0,0 +1,99 @@
+# Нагрузочный тест пула соединений Database: пропускная способность чтения
+# в зависимости от числа потоков.
+#
+#   month  - get_month_notes: запрос короткий, основное время уходит на
+#            Python (строки результата), поэтому потоки упираются в GIL и
+#            почти не масштабируются;
+#   search - полнотекстовый поиск с ранжированием по всем заметкам семьи:
+#            работа внутри SQLite, который отпускает GIL на время запроса,
+#            и выигрыш от потоков виден, если есть свободные ядра.
+#
+# Ускорение считается относительно первого числа потоков. На машине с одним
+# ядром масштабирования не будет ни у одного запроса.
+#
+#   python benchmarks/bench_sqlite_pool.py --families 500 --notes 100 --seconds 3
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+
+def fill(db, families, notes_per_family):
+    family_ids = []
+    with db.transaction():
+        for i in range(families):
+            family_id = db.create_family(f"F{i:07d}", f"Семья {i}")
+            db.add_user(i, f"user{i}", f"Пользователь {i}", family_id)
+            family_ids.append(family_id)
+    for family_id in family_ids:
+        db.add_notes([
+            {
+                'user_id': family_id - 1,
+                'family_id': family_id,
+                'title': f"Событие {n}",
+                'note_date': f"2026-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
+                'note_time': f"{random.randint(0, 23):02d}:{random.choice((0, 15, 30, 45)):02d}",
+            }
+            for n in range(notes_per_family)
+        ])
+    return family_ids
+
+
+QUERIES = {
+    'month': lambda db, rnd, family_id: db.get_month_notes(family_id, 2026, rnd.randint(1, 12)),
+    # Префикс совпадает со всеми заметками семьи: SQLite ранжирует их все
+    'search': lambda db, rnd, family_id: db.search_notes(family_id, 'событ', limit=10),
+}
+
+
+def run(db, family_ids, query, threads, seconds):
+    counts = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def reader(index):
+        rnd = random.Random(index)
+        while time.perf_counter() < deadline:
+            query(db, rnd, rnd.choice(family_ids))
+            counts[index] += 1
+
+    workers = [threading.Thread(target=reader, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(counts) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--families', type=int, default=500)
+    parser.add_argument('--notes', type=int, default=100)
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--threads', default='1,2,4,8')
+    parser.add_argument('--queries', default=','.join(QUERIES))
+    args = parser.parse_args()
+
+    thread_counts = [int(t) for t in args.threads.split(',')]
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'), readers=max(thread_counts))
+        family_ids = fill(db, args.families, args.notes)
+        print(f"{args.families} семей, {args.families * args.notes} заметок, ядер: {os.cpu_count()}")
+        for name in args.queries.split(','):
+            print(name)
+            baseline = None
+            for threads in thread_counts:
+                rate = run(db, family_ids, QUERIES[name], threads, args.seconds)
+                baseline = baseline or rate
+                print(f"{threads:>3} потоков: {rate:.0f} запросов/с, x{rate / baseline:.2f}")
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# Сравнение пропускной способности обработчиков: синхронный .execute() прямо
+# в цикле событий против SupabaseStorage с пулом потоков.
+#
+#   python benchmarks/bench_storage.py --users 50 --updates 20 --latency 0.02
+#
+# Вместо настоящего Supabase поднимается локальный HTTP-сервер, который отвечает
+# на любой запрос PostgREST пустым списком с заданной задержкой.
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from supabase import create_client
+
+from storage import SupabaseStorage
+
+
+def start_stand_in_server(latency):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = json.dumps([]).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def run_sync(client, users, updates):
+    async def user(telegram_id):
+        for _ in range(updates):
+            client.table('users').select('family_id, families(name, code)').eq('telegram_id', telegram_id).execute()
+
+    await asyncio.gather(*(user(i) for i in range(users)))
+
+
+async def run_async(storage, users, updates):
+    async def user(telegram_id):
+        for _ in range(updates):
+            await storage.get_user_family(telegram_id)
+
+    await asyncio.gather(*(user(i) for i in range(users)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--updates', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+
+    server = start_stand_in_server(args.latency)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    client = create_client(url, 'stand-in-key')
+    storage = SupabaseStorage(client, max_workers=args.workers)
+    total = args.users * args.updates
+
+    for name, runner in (('sync', lambda: run_sync(client, args.users, args.updates)),
+                         ('async', lambda: run_async(storage, args.users, args.updates))):
+        started = time.perf_counter()
+        asyncio.run(runner())
+        elapsed = time.perf_counter() - started
+        print(f"{name:>5}: {total} обновлений за {elapsed:.2f} с, {total / elapsed:.1f} обновлений/с")
+
+    storage.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# Воспроизведение записанных Update на webhook с заданной частотой и замер
+# задержки ответа (p50/p99).
+#
+#   BOT_MODE=webhook WEBHOOK_BACKGROUND=0 WEBHOOK_SECRET=test python bot.py
+#   python benchmarks/bench_webhook.py --url http://127.0.0.1:8080/webhook --secret test --rate 200
+#
+# С WEBHOOK_BACKGROUND=0 ответ приходит только после завершения обработчика,
+# поэтому задержка включает время самого обработчика. --updates принимает файл
+# с одним Update JSON на строку; без него генерируются нажатия "📅 Сегодня".
+import argparse
+import asyncio
+import json
+import time
+
+import aiohttp
+
+
+def synthetic_updates(count, users):
+    for i in range(count):
+        user_id = 100000 + i % users
+        yield {
+            'update_id': i + 1,
+            'message': {
+                'message_id': i + 1,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"},
+                'text': '📅 Сегодня',
+            },
+        }
+
+
+def recorded_updates(path, count):
+    with open(path, encoding='utf-8') as f:
+        lines = [line for line in f if line.strip()]
+    for i in range(count):
+        yield json.loads(lines[i % len(lines)])
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def replay(url, secret, updates, rate):
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret else {}
+    latencies = []
+    errors = 0
+
+    async with aiohttp.ClientSession(headers=headers) as session:
+        async def post(update):
+            nonlocal errors
+            started = time.perf_counter()
+            async with session.post(url, json=update) as response:
+                await response.read()
+                if response.status != 200:
+                    errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        tasks = []
+        started = time.perf_counter()
+        for i, update in enumerate(updates):
+            # Открытый цикл: запросы уходят по расписанию, не дожидаясь ответов
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(post(update)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    return latencies, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://127.0.0.1:8080/webhook')
+    parser.add_argument('--secret', default='')
+    parser.add_argument('--updates', help='файл с Update JSON, по одному на строку')
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=200, help='обновлений в секунду')
+    parser.add_argument('--users', type=int, default=100)
+    args = parser.parse_args()
+
+    if args.updates:
+        updates = recorded_updates(args.updates, args.count)
+    else:
+        updates = synthetic_updates(args.count, args.users)
+
+    latencies, errors, elapsed = asyncio.run(replay(args.url, args.secret, updates, args.rate))
+    print(f"{len(latencies)} обновлений за {elapsed:.2f} с ({len(latencies) / elapsed:.1f}/с), ошибок: {errors}")
+    print(f"p50 {percentile(latencies, 50):.1f} мс, p99 {percentile(latencies, 99):.1f} мс, max {max(latencies):.1f} мс")
+
+
+if __name__ == '__main__':
+    main()
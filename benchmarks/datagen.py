@@ -0,0 +1,88 @@
+# Синтетические данные для бенчмарков: families семей по members участников
+# и notes заметок на семью, разбросанных по days дней вокруг сегодняшнего.
+# Строки повторяют схему Supabase; load_database переносит их в SQLite.
+import random
+from datetime import date, timedelta
+
+TITLES = ['Забрать детей', 'Врач', 'Футбол', 'Купить продукты', 'Родительское собрание',
+          'День рождения бабушки', 'Оплатить интернет', 'Прививка кошке', 'Ужин у родителей',
+          'Бассейн', 'Стоматолог', 'Билеты в театр']
+NAMES = ['Анна', 'Иван', 'Мария', 'Петр', 'Ольга', 'Сергей', 'Елена', 'Дмитрий']
+RULES = ['FREQ=DAILY', 'FREQ=WEEKLY', 'FREQ=WEEKLY;BYDAY=MO,WE,FR', 'FREQ=MONTHLY']
+
+# Идентификаторы Telegram участников начинаются отсюда
+FIRST_TELEGRAM_ID = 100000
+
+
+def telegram_id(family_index, member_index, members):
+    return FIRST_TELEGRAM_ID + family_index * members + member_index
+
+
+def generate(families=100, members=4, notes=50, days=60, recurring=0.05, seed=0, today=None):
+    rnd = random.Random(seed)
+    today = today or date.today()
+    data = {'families': [], 'users': [], 'notes': []}
+
+    for f in range(families):
+        family_id = f"family_{f:06d}"
+        data['families'].append({
+            'id': family_id,
+            'name': f"Семья {f}",
+            'code': f"{f:08X}",
+            'theme_color': '#4CAF50',
+        })
+        member_ids = []
+        for m in range(members):
+            member_id = telegram_id(f, m, members)
+            member_ids.append(member_id)
+            data['users'].append({
+                'telegram_id': member_id,
+                'username': f"user{member_id}",
+                'full_name': f"{rnd.choice(NAMES)} {f}-{m}",
+                'family_id': family_id,
+                'role': 'admin' if m == 0 else 'member',
+                'avatar_color': '#2196F3',
+            })
+        for _ in range(notes):
+            day = today + timedelta(days=rnd.randint(-days // 2, days // 2))
+            data['notes'].append({
+                'family_id': family_id,
+                'user_id': rnd.choice(member_ids),
+                'title': rnd.choice(TITLES),
+                'description': None,
+                'note_date': day.strftime('%Y-%m-%d'),
+                'note_time': f"{rnd.randint(0, 23):02d}:{rnd.choice([0, 15, 30, 45]):02d}",
+                'color_tag': '#4CAF50',
+                'reminder_minutes': rnd.choice([None, 5, 15, 30, 60]),
+                'recurrence': rnd.choice(RULES) if rnd.random() < recurring else None,
+            })
+
+    return data
+
+
+def load_database(db, data):
+    # Перенос в database.Database; возвращает соответствие id семей
+    family_ids = {}
+    with db.transaction():
+        for family in data['families']:
+            family_ids[family['id']] = db.create_family(family['code'], family['name'])
+        for user in data['users']:
+            db.add_user(user['telegram_id'], user['username'], user['full_name'], family_ids[user['family_id']],
+                        user['role'])
+    chunk = 10000
+    for start in range(0, len(data['notes']), chunk):
+        db.add_notes([
+            {
+                'user_id': note['user_id'],
+                'family_id': family_ids[note['family_id']],
+                'title': note['title'],
+                'content': note['description'],
+                'note_date': note['note_date'],
+                'note_time': note['note_time'],
+                'reminder_minutes': note['reminder_minutes'] if note['reminder_minutes'] is not None else 30,
+                'color_tag': note['color_tag'],
+                'recurrence': note['recurrence'],
+            }
+            for note in data['notes'][start:start + chunk]
+        ])
+    return family_ids
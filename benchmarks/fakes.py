@@ -0,0 +1,326 @@
+# Заглушки внешних сервисов для бенчмарков: Supabase (построитель запросов
+# PostgREST в памяти) и aiogram Bot, который только записывает отправки.
+# latency имитирует сетевую задержку одного запроса.
+import asyncio
+import copy
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from database import reminder_shard
+
+# Связи для вложенных выборок вида select('*, users(full_name)')
+FOREIGN_KEYS = {
+    ('users', 'families'): ('family_id', 'id'),
+    ('notes', 'users'): ('user_id', 'telegram_id'),
+    ('notes', 'families'): ('family_id', 'id'),
+}
+
+EMBED_RE = re.compile(r'(\w+)\(([^)]*)\)')
+
+
+def _parse_columns(columns):
+    # 'a, b, users(full_name)' -> (['a', 'b'], {'users': ['full_name']})
+    embeds = {table: [c.strip() for c in fields.split(',')] for table, fields in EMBED_RE.findall(columns)}
+    plain = [c.strip() for c in EMBED_RE.sub('', columns).split(',') if c.strip()]
+    return plain, embeds
+
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.action = 'select'
+        self.columns = '*'
+        self.payload = None
+        self.filters = []
+        self.orders = []
+        self.limit_count = None
+        self._negate = False
+
+    # Выборка и изменение
+    def select(self, columns='*', count=None):
+        self.columns = columns
+        return self
+
+    def insert(self, rows):
+        self.action, self.payload = 'insert', rows
+        return self
+
+    def update(self, values):
+        self.action, self.payload = 'update', values
+        return self
+
+    def delete(self):
+        self.action = 'delete'
+        return self
+
+    # Фильтры
+    @property
+    def not_(self):
+        self._negate = True
+        return self
+
+    def _filter(self, column, test):
+        negate, self._negate = self._negate, False
+        self.filters.append((column, (lambda value: not test(value)) if negate else test))
+        return self
+
+    def eq(self, column, value):
+        indexed = not self._negate
+        self._filter(column, lambda v: v == value)
+        if indexed:
+            self.filters[-1] += (value,)
+        return self
+
+    def neq(self, column, value):
+        return self._filter(column, lambda v: v != value)
+
+    def gt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v > value)
+
+    def gte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v >= value)
+
+    def lt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v < value)
+
+    def lte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v <= value)
+
+    def in_(self, column, values):
+        values = set(values)
+        return self._filter(column, lambda v: v in values)
+
+    def is_(self, column, value):
+        expected = None if value in (None, 'null') else value
+        return self._filter(column, lambda v: v is expected if expected is None else v == expected)
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def execute(self):
+        if self.client.latency:
+            time.sleep(self.client.latency)
+        with self.client.lock:
+            self.client.calls += 1
+            data = getattr(self, f'_{self.action}')()
+            # Как max-rows PostgREST: лишние строки молча отбрасываются
+            if self.action == 'select':
+                data = data[:self.client.max_rows]
+            return FakeResponse(data)
+
+    def _matching(self):
+        rows = None
+        # Первый фильтр на равенство идет через индекс, остальные - перебором
+        for column, test, *value in self.filters:
+            if value:
+                rows = self.client.index(self.table, column).get(value[0], [])
+                break
+        if rows is None:
+            rows = self.client.tables[self.table]
+        return [row for row in rows if all(test(row.get(column)) for column, test, *_ in self.filters)]
+
+    def _select(self):
+        rows = self._matching()
+        for column, desc in reversed(self.orders):
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        if self.limit_count is not None:
+            rows = rows[:self.limit_count]
+        plain, embeds = _parse_columns(self.columns)
+        return [self._project(row, plain, embeds) for row in rows]
+
+    def _project(self, row, plain, embeds):
+        result = dict(row) if '*' in plain else {column: row.get(column) for column in plain}
+        for table, fields in embeds.items():
+            local, remote = FOREIGN_KEYS[(self.table, table)]
+            target = self.client.index(table, remote).get(row.get(local))
+            result[table] = {field: target[0].get(field) for field in fields} if target else None
+        return result
+
+    def _insert(self):
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        # Как postgrest-py: колонки массовой вставки - объединение ключей
+        # строк, недостающие значения вставляются как NULL
+        columns = {column: None for row in rows for column in row}
+        inserted = [self.client.add_row(self.table, {**columns, **row}) for row in rows]
+        return copy.deepcopy(inserted)
+
+    def _update(self):
+        rows = self._matching()
+        for row in rows:
+            row.update(self.payload)
+        self.client.indexes.pop(self.table, None)
+        return copy.deepcopy(rows)
+
+    def _delete(self):
+        rows = self._matching()
+        ids = {id(row) for row in rows}
+        self.client.tables[self.table] = [row for row in self.client.tables[self.table] if id(row) not in ids]
+        self.client.indexes.pop(self.table, None)
+        return copy.deepcopy(rows)
+
+
+# Вызов функции базы: client.rpc(name, params).execute()
+class FakeRpc:
+    def __init__(self, client, name, params):
+        self.client = client
+        self.function = getattr(client, f'_rpc_{name}')
+        self.params = params
+
+    def execute(self):
+        if self.client.latency:
+            time.sleep(self.client.latency)
+        with self.client.lock:
+            self.client.calls += 1
+            data = self.function(**self.params)
+            if isinstance(data, list):
+                data = data[:self.client.max_rows]
+            return FakeResponse(data)
+
+
+# Клиент с интерфейсом supabase.Client в объеме, который нужен SupabaseStorage
+class FakeSupabase:
+    def __init__(self, latency=0.0, max_rows=1000):
+        self.latency = latency
+        # Ограничение ответа PostgREST, в Supabase по умолчанию 1000 строк
+        self.max_rows = max_rows
+        self.tables = {'families': [], 'users': [], 'notes': []}
+        self.indexes = {}  # table -> column -> value -> [rows]
+        self.lock = threading.RLock()
+        self.calls = 0
+        self._next_id = {}
+        # Таблицы supabase/reminder_delivery.sql
+        self.leases = {}   # shard -> (owner, expires_at)
+        self.claims = {}   # reminder_id -> (note_date, owner)
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return FakeRpc(self, name, params or {})
+
+    # Функции supabase/reminder_delivery.sql
+    def _rpc_acquire_reminder_leases(self, p_owner, p_shards, p_ttl_seconds):
+        now = datetime.now()
+        owned = []
+        for shard in p_shards:
+            owner, expires_at = self.leases.get(shard, (None, None))
+            if owner is None or owner == p_owner or expires_at < now:
+                self.leases[shard] = (p_owner, now + timedelta(seconds=p_ttl_seconds))
+                owned.append({'shard': shard})
+        return owned
+
+    def _rpc_reminder_notes(self, p_start, p_end, p_series, p_after_id, p_shards, p_shard_count, p_limit):
+        query = self.table('notes').select('*, users(full_name)').lte('note_date', p_end)
+        if p_series:
+            query = query.not_.is_('recurrence', 'null')
+        else:
+            query = query.is_('recurrence', 'null').gte('note_date', p_start)
+        if p_after_id is not None:
+            query = query.gt('id', p_after_id)
+        shards = set(p_shards)
+        notes = [note for note in query.order('id')._select() if reminder_shard(note['family_id'], p_shard_count) in shards]
+        return notes[:p_limit]
+
+    def _rpc_release_reminder_leases(self, p_owner):
+        self.leases = {shard: lease for shard, lease in self.leases.items() if lease[0] != p_owner}
+        return None
+
+    def _rpc_claim_reminders(self, p_owner, p_ids, p_note_ids, p_dates):
+        oldest = (datetime.now() - timedelta(days=2)).strftime('%Y-%m-%d')
+        self.claims = {key: claim for key, claim in self.claims.items() if claim[0] >= oldest}
+        notes = self.index('notes', 'id')
+        claimed = []
+        for reminder_id, note_id, note_date in zip(p_ids, p_note_ids, p_dates):
+            if reminder_id not in self.claims and note_id in notes:
+                self.claims[reminder_id] = (note_date, p_owner)
+                claimed.append({'reminder_id': reminder_id})
+        return claimed
+
+    def index(self, table, column):
+        columns = self.indexes.setdefault(table, {})
+        if column not in columns:
+            index = {}
+            for row in self.tables[table]:
+                index.setdefault(row.get(column), []).append(row)
+            columns[column] = index
+        return columns[column]
+
+    def add_row(self, table, row):
+        row = dict(row)
+        if table == 'notes':
+            if 'id' not in row:
+                row['id'] = self._new_id(table)
+            row.setdefault('created_at', datetime.now().isoformat())
+            for column in ('description', 'recurrence', 'reminder_minutes'):
+                row.setdefault(column, None)
+        self.tables[table].append(row)
+        for column, index in self.indexes.get(table, {}).items():
+            index.setdefault(row.get(column), []).append(row)
+        return row
+
+    def load(self, data):
+        # data - словарь таблиц, как его возвращает datagen.generate
+        with self.lock:
+            for table, rows in data.items():
+                for row in rows:
+                    self.add_row(table, row)
+
+    def _new_id(self, table):
+        self._next_id[table] = self._next_id.get(table, 0) + 1
+        return self._next_id[table]
+
+
+# Вместо aiogram.Bot: отправки только записываются
+class FakeBot:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent.append((chat_id, text))
+
+
+# Минимальные Message и FSMContext для прямого вызова обработчиков bot.py
+class FakeUser:
+    def __init__(self, telegram_id, full_name):
+        self.id = telegram_id
+        self.full_name = full_name
+        self.first_name = full_name.split()[0]
+        self.username = f"user{telegram_id}"
+
+
+class FakeMessage:
+    def __init__(self, user, text):
+        self.from_user = user
+        self.text = text
+        self.answers = []
+
+    async def answer(self, text, **kwargs):
+        self.answers.append(text)
+
+
+class FakeState:
+    def __init__(self):
+        self.state = None
+
+    async def set_state(self, state):
+        self.state = state
+
+    async def clear(self):
+        self.state = None
@@ -0,0 +1,260 @@
+# Набор нагрузочных сценариев на синтетических данных. Supabase и Telegram
+# заменены заглушками из fakes.py, поэтому сценарии не ходят в сеть, а
+# --latency добавляет к каждому запросу заданную сетевую задержку.
+#
+#   python benchmarks/run_suite.py --families 200 --members 4 --notes 50 --output after.json
+#   python benchmarks/run_suite.py --scenarios database --compare before.json
+#   python benchmarks/run_suite.py --backend sqlite --output sqlite.json
+#
+# Сценарии:
+#   reminder_tick  - загрузка дня в планировщик и рассылка всех напоминаний дня
+#   message_burst  - одновременные нажатия "📅 Сегодня" всеми участниками
+#   quick_add      - быстрые заметки из нескольких строк с рассылкой семье
+#   database       - запросы database.Database на SQLite
+# Первые три вызывают обработчики bot.py и требуют установленных зависимостей бота;
+# --backend выбирает хранилище для них: заглушка Supabase или SQLite во временном файле.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datagen
+from fakes import FakeBot, FakeMessage, FakeState, FakeSupabase, FakeUser
+
+SCENARIOS = ['reminder_tick', 'message_burst', 'quick_add', 'database']
+
+
+def summarize(durations, total=None):
+    # durations - длительности отдельных операций в секундах
+    durations = sorted(durations)
+    total = total if total is not None else sum(durations)
+    return {
+        'count': len(durations),
+        'total_s': round(total, 4),
+        'ops_per_s': round(len(durations) / total, 1) if total else None,
+        'p50_ms': round(durations[len(durations) // 2] * 1000, 3),
+        'p99_ms': round(durations[min(len(durations) - 1, int(len(durations) * 0.99))] * 1000, 3),
+        'max_ms': round(durations[-1] * 1000, 3),
+    }
+
+
+async def timed(coroutine, durations):
+    started = time.perf_counter()
+    await coroutine
+    durations.append(time.perf_counter() - started)
+
+
+def setup_bot(args, data, directory):
+    # bot.py с хранилищем и отправкой на заглушках
+    import bot as app
+    from database import Database
+    from scheduler import ReminderScheduler
+    from sender import MessageSender
+    from storage import SqliteStorage, SupabaseStorage
+
+    if args.backend == 'sqlite':
+        db = Database(os.path.join(directory, 'bot.db'))
+        datagen.load_database(db, data)
+        app.storage = SqliteStorage(db, max_workers=args.db_workers)
+    else:
+        client = FakeSupabase(latency=args.latency)
+        client.load(data)
+        app.storage = SupabaseStorage(client, max_workers=args.db_workers)
+    fake_bot = FakeBot(latency=args.send_latency)
+    # Лимиты Telegram не проверяются: замеряется собственная работа бота
+    app.sender = MessageSender(fake_bot, workers=args.send_workers, global_rate=1e9, chat_rate=1e9)
+    app.scheduler = ReminderScheduler(app.storage.get_window_notes, app.send_reminders)
+    # Как в процессе с планировщиком: новые заметки попадают в его очередь
+    app.scheduler_running = True
+    app.family_cache.clear()
+    return app, fake_bot
+
+
+def members(data):
+    return [FakeUser(user['telegram_id'], user['full_name']) for user in data['users']]
+
+
+async def reminder_tick(args, data, directory):
+    from scheduler import reminder_window
+
+    app, fake_bot = setup_bot(args, data, directory)
+    app.sender.start()
+    morning = datetime.combine(date.today(), datetime.min.time())
+
+    started = time.perf_counter()
+    await app.scheduler.sync_window(*reminder_window(morning), morning)
+    sync = time.perf_counter() - started
+
+    # Конец дня: срабатывают все напоминания сегодняшнего дня
+    due = app.scheduler.pop_due(morning.replace(hour=23, minute=59))
+    started = time.perf_counter()
+    await app.send_reminders(due)
+    fire = time.perf_counter() - started
+    await app.sender.stop()
+    drain = time.perf_counter() - started
+    app.storage.close()
+
+    return {
+        'sync_ms': round(sync * 1000, 3),
+        'pending': len(app.scheduler),
+        'reminders': len(due),
+        'fire_ms': round(fire * 1000, 3),
+        'sends': len(fake_bot.sent),
+        'drain_ms': round(drain * 1000, 3),
+        'sends_per_s': round(len(fake_bot.sent) / drain, 1) if drain else None,
+        'db_calls': app.storage.queries,
+    }
+
+
+async def message_burst(args, data, directory):
+    app, fake_bot = setup_bot(args, data, directory)
+    users = members(data)
+    result = {}
+
+    # Холодный кэш семей, затем теплый
+    for phase in ('cold', 'warm'):
+        durations = []
+        calls = app.storage.queries
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            timed(app.route_button(FakeMessage(user, '📅 Сегодня'), FakeState()), durations) for user in users
+        ))
+        result[phase] = summarize(durations, time.perf_counter() - started)
+        result[phase]['db_calls'] = app.storage.queries - calls
+
+    app.storage.close()
+    return result
+
+
+async def quick_add(args, data, directory):
+    app, fake_bot = setup_bot(args, data, directory)
+    app.sender.start()
+    # Пишет один участник каждой семьи
+    authors = members(data)[::args.members]
+    text = '\n'.join([
+        'завтра 18:00-19:30 Футбол напомнить за 15 минут',
+        'в пятницу 9:30 Врач',
+        'каждый понедельник 8:00 Бассейн',
+    ])
+
+    durations = []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        timed(app.quick_add_process(FakeMessage(user, text), FakeState()), durations) for user in authors
+    ))
+    result = summarize(durations, time.perf_counter() - started)
+    await app.sender.stop()
+    result['drain_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    result['sends'] = len(fake_bot.sent)
+    result['db_calls'] = app.storage.queries
+    app.storage.close()
+    return result
+
+
+def database(args, data):
+    from database import Database
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = Database(os.path.join(directory, 'bench.db'))
+        started = time.perf_counter()
+        family_ids = list(datagen.load_database(db, data).values())
+        result = {'load_s': round(time.perf_counter() - started, 3)}
+
+        today = date.today()
+        queries = {
+            'get_family_notes_day': lambda f: db.get_family_notes(f, today.strftime('%Y-%m-%d')),
+            'get_family_notes_all': lambda f: db.get_family_notes(f),
+            'get_upcoming_notes': lambda f: db.get_upcoming_notes(f),
+            'get_month_notes': lambda f: db.get_month_notes(f, today.year, today.month),
+            'search_notes': lambda f: db.search_notes(f, 'забр дет'),
+            'get_day_notes': lambda f: db.get_day_notes(today.strftime('%Y-%m-%d'), (today + timedelta(days=1)).strftime('%Y-%m-%d')),
+        }
+        sample = family_ids[:args.repeat]
+        for name, query in queries.items():
+            durations = []
+            for family_id in sample:
+                query_started = time.perf_counter()
+                query(family_id)
+                durations.append(time.perf_counter() - query_started)
+            result[name] = summarize(durations)
+
+        db.close()
+    return result
+
+
+def compare(results, baseline):
+    # Относительное изменение времени: отрицательное - стало быстрее
+    def walk(current, previous, path):
+        for key, value in current.items():
+            old = previous.get(key) if isinstance(previous, dict) else None
+            if isinstance(value, dict):
+                walk(value, old, path + [key])
+            elif key.endswith(('_ms', '_s')) and not key.endswith('per_s') and isinstance(value, (int, float)) and old:
+                change = (value - old) / old * 100
+                print(f"  {'.'.join(path + [key]):<50} {old:>12} -> {value:<12} {change:+.1f}%")
+
+    walk(results, baseline.get('results', {}), [])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--backend', choices=['supabase', 'sqlite'], default='supabase')
+    parser.add_argument('--families', type=int, default=200)
+    parser.add_argument('--members', type=int, default=4)
+    parser.add_argument('--notes', type=int, default=50, help='заметок на семью')
+    parser.add_argument('--recurring', type=float, default=0.05, help='доля серий среди заметок')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка запроса к Supabase, с')
+    parser.add_argument('--send-latency', type=float, default=0.0, help='задержка send_message, с')
+    parser.add_argument('--db-workers', type=int, default=8)
+    parser.add_argument('--send-workers', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=100, help='семей в сценарии database')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help='JSON прошлого запуска для сравнения')
+    args = parser.parse_args()
+
+    data = datagen.generate(args.families, args.members, args.notes, recurring=args.recurring, seed=args.seed)
+    runners = {
+        'reminder_tick': lambda directory: asyncio.run(reminder_tick(args, data, directory)),
+        'message_burst': lambda directory: asyncio.run(message_burst(args, data, directory)),
+        'quick_add': lambda directory: asyncio.run(quick_add(args, data, directory)),
+        'database': lambda directory: database(args, data),
+    }
+
+    results = {}
+    for name in args.scenarios.split(','):
+        print(f"{name}...", flush=True)
+        with tempfile.TemporaryDirectory() as directory:
+            results[name] = runners[name](directory)
+
+    report = {
+        'meta': {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"Сравнение с {args.compare}:")
+        compare(results, baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,31 @@
 import asyncio
+import hashlib
+import hmac
+import multiprocessing
 import os
 import json
 import secrets
-from datetime import datetime, timedelta
-from aiogram import Bot, Dispatcher, types
+import socket
+import tempfile
+from datetime import datetime
+from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, WebAppInfo
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, WebAppInfo, FSInputFile
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 from supabase import create_client, Client
+from scheduler import DEFAULT_REMINDER_MINUTES, ReminderScheduler, reminder_window
+from storage import SupabaseStorage, SqliteStorage
+from database import Database
+from cache import TTLCache
+from sender import GLOBAL_RATE, MessageSender
+from note_parser import parse_message
+from recurrence import expand_note
+from metrics import REGISTRY, HandlerMetrics, SlowTickProfiler, register_cache
+from calendar_io import PARSERS, import_notes, stream_csv, stream_ics
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -14,13 +33,88 @@ logging.basicConfig(level=logging.INFO)
 # Конфигурация
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN', '8524212627:AAGaH7zqqpPdo6ZMVryA62TcjLOvSG6aDY4')
 SUPABASE_URL = os.getenv('SUPABASE_URL', 'https://rgsshworixeptoivrqlr.supabase.co')
+# Функции рассылки напоминаний (supabase/reminder_delivery.sql) доступны
+# только service_role: боту и reminder_worker.py нужен ключ service_role,
+# публичный ключ подходит только для веб-календаря
 SUPABASE_KEY = os.getenv('SUPABASE_KEY', 'sb_publishable_2ly2CVhHRMrd_T_MHAk7Uw_pqfSCZGC')
+DB_WORKERS = int(os.getenv('DB_WORKERS', '8'))
+# Хранилище: supabase или sqlite (один узел без сетевых запросов к БД)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'supabase')
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'family_notes.db')
+FAMILY_CACHE_SIZE = int(os.getenv('FAMILY_CACHE_SIZE', '10000'))
+FAMILY_CACHE_TTL = int(os.getenv('FAMILY_CACHE_TTL', '300'))
+# Срок жизни записи "нет семьи" при нескольких процессах webhook: вступление
+# сбрасывает кэш только в процессе, который его обработал
+FAMILY_CACHE_NEGATIVE_TTL = int(os.getenv('FAMILY_CACHE_NEGATIVE_TTL', '5'))
+SEND_WORKERS = int(os.getenv('SEND_WORKERS', '8'))
 WEB_APP_URL = os.getenv('WEB_APP_URL', 'https://max0209-web.github.io/-/')
 
+# Режим работы: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '1'))
+WEBHOOK_BACKGROUND = os.getenv('WEBHOOK_BACKGROUND', '1') == '1'
+# Состояния ввода (код семьи, быстрая заметка) хранятся в памяти процесса или
+# в Redis; при нескольких процессах webhook ответ приходит в любой из них,
+# поэтому там нужен Redis
+FSM_REDIS_URL = os.getenv('FSM_REDIS_URL', '')
+# Встроенный планировщик работает только в процессе webhook 0; при отдельном
+# reminder_worker.py его выключают через RUN_SCHEDULER=0
+RUN_SCHEDULER = os.getenv('RUN_SCHEDULER', '1') == '1'
+# Напоминания захватываются в БД пачками перед отправкой, поэтому реплики
+# не отправляют одно напоминание дважды
+REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', '100'))
+REMINDER_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+# Метрики Prometheus на локальном порту (у процесса webhook N - порт + N), 0 отключает
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
+# Профили медленных тактов планировщика; без PROFILE_DIR профилирование выключено
+PROFILE_DIR = os.getenv('PROFILE_DIR', '')
+PROFILE_SLOW_TICK = float(os.getenv('PROFILE_SLOW_TICK', '1.0'))
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0.1'))
+# Импорт .ics/.csv: заметки вставляются пачками по IMPORT_CHUNK_SIZE;
+# Telegram отдает ботам файлы не больше 20 МБ
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '500'))
+IMPORT_MAX_MB = int(os.getenv('IMPORT_MAX_MB', '20'))
+# Подписка на календарь: FEED_URL - внешний адрес, по которому доступен
+# /calendar/... (в режиме webhook - сервер webhook, иначе FEED_HOST:FEED_PORT).
+# FEED_SECRET подписывает ссылки; без него подписка выключена
+FEED_URL = os.getenv('FEED_URL', '')
+FEED_SECRET = os.getenv('FEED_SECRET', '')
+FEED_HOST = os.getenv('FEED_HOST', '0.0.0.0')
+FEED_PORT = int(os.getenv('FEED_PORT', '0'))
+
 # Инициализация
 bot = Bot(token=TELEGRAM_TOKEN)
-dp = Dispatcher()
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+if FSM_REDIS_URL:
+    from aiogram.fsm.storage.redis import RedisStorage
+    fsm_storage = RedisStorage.from_url(FSM_REDIS_URL)
+else:
+    fsm_storage = MemoryStorage()
+dp = Dispatcher(storage=fsm_storage)
+# Лимит Telegram общий для токена, поэтому делится между процессами webhook
+sender = MessageSender(bot, workers=SEND_WORKERS,
+                       global_rate=GLOBAL_RATE / WEBHOOK_WORKERS if BOT_MODE == 'webhook' else GLOBAL_RATE)
+if STORAGE_BACKEND == 'sqlite':
+    storage = SqliteStorage(Database(SQLITE_PATH), max_workers=DB_WORKERS)
+else:
+    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    storage = SupabaseStorage(supabase, max_workers=DB_WORKERS)
+# telegram_id -> (family_id, family); сбрасывается при создании семьи и вступлении
+family_cache = TTLCache(maxsize=FAMILY_CACHE_SIZE, ttl=FAMILY_CACHE_TTL)
+register_cache('family', family_cache)
+# Планировщик напоминаний работает только в одном процессе (см. on_startup);
+# в остальных новые заметки в его очередь не добавляются
+scheduler_running = False
+
+# Состояния для свободного текста: код семьи или быстрая заметка
+class UserStates(StatesGroup):
+    awaiting_family_code = State()
+    awaiting_quick_note = State()
 
 def get_main_keyboard(family_id=None):
     keyboard = []
@@ -35,13 +129,30 @@ def get_main_keyboard(family_id=None):
     return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
 
 async def get_user_family(user_id):
-    result = supabase.table('users').select('family_id, families(name, code)').eq('telegram_id', user_id).execute()
-    if result.data:
-        return result.data[0]['family_id'], result.data[0]['families']
-    return None, None
+    cached = family_cache.get(user_id)
+    if cached is not None:
+        return cached
+    result = await storage.get_user_family(user_id)
+    negative = result[0] is None and WEBHOOK_WORKERS > 1
+    family_cache.set(user_id, result, ttl=FAMILY_CACHE_NEGATIVE_TTL if negative else None)
+    return result
+
+def schedule_notes(notes, author_name):
+    # Новые заметки сразу встают в очередь планировщика, не дожидаясь его
+    # опроса. Разовые заметки expand_note отдает при любой дате, поэтому
+    # даты сверяются с окном планировщика
+    if not scheduler_running:
+        return
+    start, end, _ = reminder_window(datetime.now())
+    for note in notes:
+        note['users'] = {'full_name': author_name}
+        for occurrence in expand_note(note, start, end):
+            if start <= occurrence['note_date'] <= end:
+                scheduler.add(occurrence)
 
 @dp.message(Command("start"))
-async def cmd_start(message: types.Message):
+async def cmd_start(message: types.Message, state: FSMContext):
+    await state.clear()
     user_id = message.from_user.id
     
     family_id, family_data = await get_user_family(user_id)
@@ -63,26 +174,27 @@ async def cmd_start(message: types.Message):
             reply_markup=get_main_keyboard()
         )
 
-@dp.message(lambda message: message.text == "👨‍👩‍👧‍👦 Создать семью")
-async def create_family(message: types.Message):
+async def create_family(message: types.Message, state: FSMContext):
     family_code = secrets.token_hex(4).upper()
-    family_id = f"family_{secrets.token_hex(8)}"
     
-    supabase.table('families').insert({
-        'id': family_id,
+    # SQLite назначает свой id, поэтому дальше используется id из ответа
+    family = await storage.create_family({
+        'id': f"family_{secrets.token_hex(8)}",
         'name': f"Семья {message.from_user.first_name}",
         'code': family_code,
         'theme_color': '#4CAF50'
-    }).execute()
+    })
+    family_id = family['id']
     
-    supabase.table('users').insert({
+    await storage.add_user({
         'telegram_id': message.from_user.id,
         'username': message.from_user.username,
         'full_name': message.from_user.full_name,
         'family_id': family_id,
         'role': 'admin',
         'avatar_color': '#2196F3'
-    }).execute()
+    })
+    family_cache.invalidate(message.from_user.id)
     
     webapp_url = f"{WEB_APP_URL}/?family={family_id}"
     
@@ -97,30 +209,29 @@ async def create_family(message: types.Message):
         reply_markup=get_main_keyboard(family_id)
     )
 
-@dp.message(lambda message: message.text == "🔗 Присоединиться")
-async def join_family_start(message: types.Message):
+async def join_family_start(message: types.Message, state: FSMContext):
+    await state.set_state(UserStates.awaiting_family_code)
     await message.answer("Введите код семьи:")
 
-@dp.message(lambda message: message.text and len(message.text) == 8)
-async def join_family_process(message: types.Message):
-    family_code = message.text.upper()
+async def join_family_process(message: types.Message, state: FSMContext):
+    family_code = message.text.strip().upper()
     
-    result = supabase.table('families').select('id, name').eq('code', family_code).execute()
+    family = await storage.get_family_by_code(family_code) if len(family_code) == 8 else None
     
-    if not result.data:
+    if not family:
         await message.answer("❌ Семьи с таким кодом не найдено.")
         return
     
-    family = result.data[0]
-    
-    supabase.table('users').insert({
+    await storage.add_user({
         'telegram_id': message.from_user.id,
         'username': message.from_user.username,
         'full_name': message.from_user.full_name,
         'family_id': family['id'],
         'role': 'member',
         'avatar_color': '#FF9800'
-    }).execute()
+    })
+    family_cache.invalidate(message.from_user.id)
+    await state.clear()
     
     webapp_url = f"{WEB_APP_URL}/?family={family['id']}"
     
@@ -133,71 +244,82 @@ async def join_family_process(message: types.Message):
         reply_markup=get_main_keyboard(family['id'])
     )
 
-@dp.message(lambda message: message.text == "➕ Быстро добавить")
-async def quick_add_start(message: types.Message):
+async def quick_add_start(message: types.Message, state: FSMContext):
     family_id, _ = await get_user_family(message.from_user.id)
     
     if not family_id:
         await message.answer("Сначала присоединитесь к семье!")
         return
     
-    await message.answer("Введите название события одним сообщением:\n\nПример: 'Забрать детей 18:00'")
+    await state.set_state(UserStates.awaiting_quick_note)
+    await message.answer(
+        "Введите событие одним сообщением, можно несколько строк:\n\n"
+        "Пример: 'Забрать детей 18:00' или 'завтра 9:30 Врач'"
+    )
 
-@dp.message(lambda message: len(message.text) > 5 and ' ' in message.text)
-async def quick_add_process(message: types.Message):
+async def quick_add_process(message: types.Message, state: FSMContext):
     family_id, family_data = await get_user_family(message.from_user.id)
     
     if not family_id:
+        await state.clear()
         return
     
-    text = message.text
-    words = text.split()
-    
-    time_part = None
-    title_parts = []
+    parsed, errors = parse_message(message.text)
     
-    for word in words:
-        if ':' in word and word.replace(':', '').isdigit():
-            time_part = word
-        else:
-            title_parts.append(word)
-    
-    if not time_part:
-        await message.answer("Укажите время в формате ЧЧ:ММ")
+    if not parsed:
+        await message.answer(
+            "Укажите время в формате ЧЧ:ММ\n\n"
+            "Примеры: 'Забрать детей 18:00', 'завтра 9:30 Врач', "
+            "'в пятницу 18:00-19:30 Футбол напомнить за 15 минут'"
+        )
         return
     
-    title = ' '.join(title_parts)
     today = datetime.now().strftime('%Y-%m-%d')
-    
-    note_data = {
-        'family_id': family_id,
-        'user_id': message.from_user.id,
-        'title': title,
-        'note_date': today,
-        'note_time': time_part,
-        'color_tag': '#4CAF50'
-    }
-    
-    supabase.table('notes').insert(note_data).execute()
-    
-    family_members = supabase.table('users').select('telegram_id').eq('family_id', family_id).execute()
-    
-    for member in family_members.data:
-        if member['telegram_id'] != message.from_user.id:
-            try:
-                await bot.send_message(
-                    member['telegram_id'],
-                    f"📢 Новая заметка от {message.from_user.full_name}:\n"
-                    f"📌 {title}\n"
-                    f"📅 Сегодня ⏰ {time_part}"
-                )
-            except:
-                pass
-    
-    await message.answer(f"✅ Заметка добавлена для всей семьи!")
-
-@dp.message(lambda message: message.text == "📅 Сегодня")
-async def show_today(message: types.Message):
+    notes_data = []
+    
+    # У всех строк вставки одни и те же ключи: postgrest-py отправляет
+    # объединение ключей, и недостающие стали бы NULL вместо значений по умолчанию
+    for item in parsed:
+        reminder_minutes = item['reminder_minutes']
+        notes_data.append({
+            'family_id': family_id,
+            'user_id': message.from_user.id,
+            'title': item['title'],
+            'description': f"До {item['end_time']}" if item['end_time'] else None,
+            'note_date': item['note_date'],
+            'note_time': item['note_time'],
+            'reminder_minutes': DEFAULT_REMINDER_MINUTES if reminder_minutes is None else reminder_minutes,
+            'recurrence': item['recurrence'],
+            'color_tag': '#4CAF50'
+        })
+    
+    # Все заметки сообщения добавляются одной вставкой
+    inserted = await storage.add_notes(notes_data)
+    schedule_notes(inserted, message.from_user.full_name)
+    
+    lines = []
+    for note in notes_data:
+        day = "Сегодня" if note['note_date'] == today else note['note_date']
+        repeat = " 🔁" if note.get('recurrence') else ""
+        lines.append(f"📌 {note['title']}\n📅 {day} ⏰ {note['note_time']}{repeat}")
+    
+    members_map = await storage.get_members_map([family_id])
+    
+    for telegram_id in members_map[family_id]:
+        if telegram_id != message.from_user.id:
+            sender.send(
+                telegram_id,
+                f"📢 Новая заметка от {message.from_user.full_name}:\n" + "\n\n".join(lines)
+            )
+    
+    await state.clear()
+    
+    response = "✅ Заметка добавлена для всей семьи!" if len(notes_data) == 1 else f"✅ Добавлено заметок: {len(notes_data)}"
+    if errors:
+        response += "\n\n⚠️ Не удалось разобрать:\n" + "\n".join(errors)
+    await message.answer(response)
+
+async def show_today(message: types.Message, state: FSMContext):
     family_id, family_data = await get_user_family(message.from_user.id)
     
     if not family_id:
@@ -205,15 +327,15 @@ async def show_today(message: types.Message):
     
     today = datetime.now().strftime('%Y-%m-%d')
     
-    result = supabase.table('notes').select('*, users(full_name, avatar_color)').eq('family_id', family_id).eq('note_date', today).order('note_time').execute()
+    notes = await storage.get_family_day_notes(family_id, today)
     
-    if not result.data:
+    if not notes:
         await message.answer("🎉 На сегодня событий нет!")
         return
     
     response = f"📅 Заметки на сегодня:\n\n"
     
-    for note in result.data:
+    for note in notes:
         time_str = note['note_time'][:5] if isinstance(note['note_time'], str) else str(note['note_time'])
         author = note['users']['full_name'] if note['users'] else 'Неизвестно'
         
@@ -222,64 +344,282 @@ async def show_today(message: types.Message):
     
     await message.answer(response)
 
-@dp.message(lambda message: message.text == "👨‍👩‍👧‍👦 Семья")
-async def show_family(message: types.Message):
+async def show_family(message: types.Message, state: FSMContext):
     family_id, family_data = await get_user_family(message.from_user.id)
     
     if not family_id:
         return
     
-    members = supabase.table('users').select('full_name, role').eq('family_id', family_id).execute()
+    members = await storage.get_family_members(family_id)
     
     response = f"🏠 Семья: {family_data['name']}\n"
     response += f"🔑 Код: {family_data['code']}\n\n"
-    response += f"👥 Участники ({len(members.data)}):\n"
+    response += f"👥 Участники ({len(members)}):\n"
     
-    for member in members.data:
+    for member in members:
         role_icon = "👑" if member['role'] == 'admin' else "👤"
         response += f"{role_icon} {member['full_name']}\n"
     
     await message.answer(response)
 
-async def send_reminders():
-    today = datetime.now().strftime('%Y-%m-%d')
-    current_time = datetime.now().strftime('%H:%M')
+async def import_calendar(message: types.Message, state: FSMContext):
+    family_id, _ = await get_user_family(message.from_user.id)
+    
+    if not family_id:
+        await message.answer("Сначала присоединитесь к семье!")
+        return
+    
+    document = message.document
+    parser = PARSERS.get(os.path.splitext(document.file_name or '')[1].lower())
+    if not parser:
+        await message.answer("📥 Для импорта пришлите файл .ics или .csv")
+        return
+    if (document.file_size or 0) > IMPORT_MAX_MB * 1024 * 1024:
+        await message.answer(f"❌ Файл больше {IMPORT_MAX_MB} МБ")
+        return
     
-    result = supabase.table('notes').select('*, families(name), users(telegram_id, full_name)').eq('note_date', today).execute()
+    await state.clear()
+    
+    def schedule(inserted):
+        schedule_notes(inserted, message.from_user.full_name)
+    
+    # Файл читается построчно с диска, в памяти только текущая пачка
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'import')
+        await bot.download(document, destination=path)
+        with open(path, encoding='utf-8-sig', errors='replace', newline='') as f:
+            imported, errors = await import_notes(
+                storage,
+                parser(f),
+                {'family_id': family_id, 'user_id': message.from_user.id, 'color_tag': '#4CAF50'},
+                IMPORT_CHUNK_SIZE,
+                on_chunk=schedule
+            )
+    
+    # Вместо уведомления на каждую заметку - одно на весь импорт
+    if imported:
+        members_map = await storage.get_members_map([family_id])
+        for telegram_id in members_map[family_id]:
+            if telegram_id != message.from_user.id:
+                sender.send(telegram_id, f"📥 {message.from_user.full_name} импортировал событий: {imported}")
+    
+    response = f"✅ Импортировано событий: {imported}"
+    if errors:
+        response += f"\n\n⚠️ Пропущено: {len(errors)}\n" + "\n".join(errors[:10])
+        if len(errors) > 10:
+            response += "\n..."
+    await message.answer(response)
+
+@dp.message(Command("export"))
+async def cmd_export(message: types.Message, state: FSMContext):
+    family_id, family_data = await get_user_family(message.from_user.id)
     
-    for note in result.data:
+    if not family_id:
+        await message.answer("Сначала присоединитесь к семье!")
+        return
+    
+    as_csv = (message.text or '').split()[1:2] == ['csv']
+    chunks = stream_csv(storage, family_id) if as_csv else stream_ics(storage, family_id, family_data['name'])
+    
+    # Заметки пишутся в файл по страницам, история семьи в память не загружается
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'export')
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            async for chunk in chunks:
+                f.write(chunk)
+        await message.answer_document(
+            FSInputFile(path, filename='family_calendar.csv' if as_csv else 'family_calendar.ics'),
+            caption="📤 Календарь семьи"
+        )
+
+def feed_signature(family_id):
+    return hmac.new(FEED_SECRET.encode(), str(family_id).encode(), hashlib.sha256).hexdigest()[:32]
+
+@dp.message(Command("feed"))
+async def cmd_feed(message: types.Message, state: FSMContext):
+    family_id, _ = await get_user_family(message.from_user.id)
+    
+    if not family_id:
+        await message.answer("Сначала присоединитесь к семье!")
+        return
+    if not FEED_URL or not FEED_SECRET:
+        await message.answer("❌ Подписка на календарь не настроена")
+        return
+    
+    await message.answer(
+        f"🔗 Ссылка для подписки в Google/Apple Календаре:\n"
+        f"<code>{FEED_URL}/calendar/{family_id}/{feed_signature(family_id)}.ics</code>\n\n"
+        f"Не пересылайте ее посторонним: по ссылке виден весь календарь семьи.",
+        parse_mode="HTML"
+    )
+
+# Кнопки клавиатуры: текст -> обработчик, выбор за O(1) без перебора фильтров
+BUTTON_HANDLERS = {
+    "👨‍👩‍👧‍👦 Создать семью": create_family,
+    "🔗 Присоединиться": join_family_start,
+    "➕ Быстро добавить": quick_add_start,
+    "📅 Сегодня": show_today,
+    "👨‍👩‍👧‍👦 Семья": show_family,
+}
+
+async def route_button(message: types.Message, state: FSMContext):
+    # Нажатие кнопки прерывает незаконченный ввод
+    await state.clear()
+    await BUTTON_HANDLERS[message.text](message, state)
+
+async def fallback_text(message: types.Message, state: FSMContext):
+    # Текст вне ввода: подсказка вместо молчания. Не зависит от состояния,
+    # поэтому отвечает и после перезапуска, потерявшего состояния в памяти
+    family_id, _ = await get_user_family(message.from_user.id)
+    
+    if family_id:
+        await message.answer(
+            "Чтобы добавить заметку, нажмите «➕ Быстро добавить» и напишите, например, "
+            "'завтра 9:30 Врач'",
+            reply_markup=get_main_keyboard(family_id)
+        )
+    else:
+        await message.answer(
+            "Создайте семью или присоединитесь к ней по коду кнопками ниже",
+            reply_markup=get_main_keyboard()
+        )
+
+# Порядок важен: кнопки проверяются раньше состояний ввода
+dp.message.register(route_button, F.text.in_(BUTTON_HANDLERS))
+dp.message.register(join_family_process, UserStates.awaiting_family_code, F.text)
+dp.message.register(quick_add_process, UserStates.awaiting_quick_note, F.text)
+dp.message.register(import_calendar, F.document)
+# Последним: любой текст, не подошедший остальным обработчикам
+dp.message.register(fallback_text, F.text)
+
+def handler_name(message, callback):
+    # Кнопки считаются по их обработчикам, а не по общему route_button
+    if callback is route_button:
+        return BUTTON_HANDLERS[message.text].__name__
+    return callback.__name__
+
+dp.message.middleware(HandlerMetrics(handler_name))
+
+async def send_reminders(notes):
+    for start in range(0, len(notes), REMINDER_BATCH_SIZE):
+        batch = await storage.claim_reminders(notes[start:start + REMINDER_BATCH_SIZE], REMINDER_OWNER)
+        if batch:
+            await deliver_reminders(batch)
+
+async def deliver_reminders(notes):
+    members_map = await storage.get_members_map({note['family_id'] for note in notes})
+    today = datetime.now().strftime('%Y-%m-%d')
+    
+    for note in notes:
         note_time = note['note_time'][:5] if isinstance(note['note_time'], str) else str(note['note_time'])
+        # Напоминание за несколько дней показывает и дату события
+        if str(note['note_date']) != today:
+            note_time = f"{note['note_date']} {note_time}"
+        author_name = note['users']['full_name'] if note.get('users') else 'Неизвестно'
         
-        if note_time <= current_time:
-            family_name = note['families']['name'] if note['families'] else 'Семья'
-            author_name = note['users']['full_name'] if note['users'] else 'Неизвестно'
-            
-            members = supabase.table('users').select('telegram_id').eq('family_id', note['family_id']).execute()
-            
-            for member in members.data:
-                try:
-                    await bot.send_message(
-                        member['telegram_id'],
-                        f"🔔 НАПОМИНАНИЕ\n\n"
-                        f"📌 {note['title']}\n"
-                        f"⏰ {note_time}\n"
-                        f"👤 {author_name}"
-                    )
-                except:
-                    pass
-
-async def reminder_scheduler():
-    while True:
-        await asyncio.sleep(60)
-        await send_reminders()
+        for telegram_id in members_map[note['family_id']]:
+            sender.send(
+                telegram_id,
+                f"🔔 НАПОМИНАНИЕ\n\n"
+                f"📌 {note['title']}\n"
+                f"⏰ {note_time}\n"
+                f"👤 {author_name}"
+            )
+
+scheduler = ReminderScheduler(
+    storage.get_window_notes,
+    send_reminders,
+    load_new=storage.get_new_notes,
+    profiler=SlowTickProfiler(PROFILE_DIR or None, PROFILE_SLOW_TICK, PROFILE_SAMPLE_RATE)
+)
+
+async def metrics_handler(request):
+    return web.Response(text=REGISTRY.render(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+async def start_metrics_server(port):
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, port).start()
+
+async def calendar_feed(request):
+    family_id = request.match_info['family_id']
+    if not hmac.compare_digest(request.match_info['signature'], feed_signature(family_id)):
+        raise web.HTTPNotFound()
+    
+    response = web.StreamResponse(headers={'Content-Type': 'text/calendar; charset=utf-8'})
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+    async for chunk in stream_ics(storage, family_id, "Семейный календарь"):
+        await response.write(chunk.encode('utf-8'))
+    await response.write_eof()
+    return response
+
+def add_feed_routes(app):
+    if not FEED_SECRET:
+        return
+    app.router.add_get('/calendar/{family_id}/{signature}.ics', calendar_feed)
+
+async def start_feed_server():
+    app = web.Application()
+    add_feed_routes(app)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, FEED_HOST, FEED_PORT).start()
+
+async def on_startup(bot: Bot, worker_index: int = 0):
+    global scheduler_running
+    sender.start()
+    if METRICS_PORT:
+        await start_metrics_server(METRICS_PORT + worker_index)
+    # В режиме webhook подписка обслуживается сервером webhook
+    if FEED_PORT and FEED_SECRET and BOT_MODE != 'webhook':
+        await start_feed_server()
+    if RUN_SCHEDULER and worker_index == 0:
+        scheduler_running = True
+        asyncio.create_task(scheduler.run())
+    if BOT_MODE == 'webhook' and worker_index == 0 and WEBHOOK_URL:
+        await bot.set_webhook(f"{WEBHOOK_URL}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET)
+
+dp.startup.register(on_startup)
+
+def run_webhook(worker_index=0):
+    dp['worker_index'] = worker_index
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=WEBHOOK_BACKGROUND
+    ).register(app, path=WEBHOOK_PATH)
+    add_feed_routes(app)
+    setup_application(app, dp, bot=bot)
+    # reuse_port позволяет нескольким процессам слушать один порт
+    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT, reuse_port=WEBHOOK_WORKERS > 1, print=None)
 
 async def main():
-    asyncio.create_task(reminder_scheduler())
-    
     print("🤖 Бот запущен с Supabase!")
     print(f"🌐 Web App: {WEB_APP_URL}")
     
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if BOT_MODE == 'webhook':
+        # Без секрета любой, кто знает адрес, может слать боту поддельные апдейты
+        if not WEBHOOK_SECRET:
+            raise SystemExit("Режим webhook требует WEBHOOK_SECRET")
+        if WEBHOOK_WORKERS > 1 and not FSM_REDIS_URL:
+            raise SystemExit("WEBHOOK_WORKERS > 1 требует FSM_REDIS_URL: состояния ввода в памяти не видны другим процессам")
+        print(f"🤖 Бот запущен в режиме webhook: {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}, процессов: {WEBHOOK_WORKERS}")
+        # spawn: соединения SQLite и HTTP-клиенты открываются при импорте
+        # модуля и не должны наследоваться дочерними процессами через fork
+        context = multiprocessing.get_context('spawn')
+        workers = [context.Process(target=run_webhook, args=(i,)) for i in range(1, WEBHOOK_WORKERS)]
+        for worker in workers:
+            worker.start()
+        run_webhook(0)
+        for worker in workers:
+            worker.join()
+    else:
+        asyncio.run(main())
@@ -0,0 +1,312 @@
+import csv
+import io
+import re
+from datetime import datetime, timezone
+
+from recurrence import parse_rule
+from scheduler import DEFAULT_REMINDER_MINUTES, MAX_REMINDER_MINUTES
+
+# Импорт и экспорт календаря семьи в iCalendar (RFC 5545) и CSV.
+# Разбор идет генераторами по строкам файла, экспорт - по страницам заметок,
+# поэтому ни файл, ни история семьи целиком в памяти не держатся.
+
+CSV_COLUMNS = ['date', 'time', 'title', 'description', 'reminder_minutes', 'recurrence']
+# Время для событий на весь день: у заметок время обязательно
+ALL_DAY_TIME = '09:00'
+MAX_TITLE_LENGTH = 200
+RRULE_KEYS = ('FREQ', 'INTERVAL', 'BYDAY', 'COUNT', 'UNTIL')
+
+TRIGGER_RE = re.compile(r'^-P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:\d+S)?)?$')
+TIME_RE = re.compile(r'^(\d{1,2}):(\d{2})(?::\d{2})?$')
+
+
+def chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Проверка полей
+def _parse_date(value):
+    value = value.strip()
+    for fmt in ('%Y-%m-%d', '%d.%m.%Y', '%Y%m%d'):
+        try:
+            return datetime.strptime(value, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    raise ValueError(f"неверная дата '{value}'")
+
+
+def _parse_time(value):
+    match = TIME_RE.match(value.strip())
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        raise ValueError(f"неверное время '{value}'")
+    return f"{int(match.group(1)):02d}:{match.group(2)}"
+
+
+def _parse_recurrence(value):
+    # Из RRULE остается поддерживаемое подмножество, см. recurrence.py
+    parts = [part for part in value.strip().upper().split(';') if part.split('=', 1)[0] in RRULE_KEYS]
+    rule = ';'.join(part[:14] if part.startswith('UNTIL=') else part for part in parts)
+    if not rule:
+        return None
+    try:
+        parsed = parse_rule(rule)
+    except (ValueError, KeyError):
+        raise ValueError(f"неверное правило повтора '{value}'")
+    if parsed['freq'] not in ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY'):
+        raise ValueError(f"неподдерживаемая частота повтора {parsed['freq']}")
+    return rule
+
+
+def _parse_minutes(value):
+    value = value.strip()
+    if not value:
+        return None
+    if not value.isdigit():
+        raise ValueError(f"неверное напоминание '{value}'")
+    return int(value)
+
+
+def _validate(note):
+    title = (note.get('title') or '').strip()
+    if not title:
+        raise ValueError("нет названия")
+    if len(title) > MAX_TITLE_LENGTH:
+        raise ValueError("слишком длинное название")
+    # Срок из reminder_minutes CSV или TRIGGER будильника .ics
+    if (note.get('reminder_minutes') or 0) > MAX_REMINDER_MINUTES:
+        raise ValueError("напоминание раньше чем за неделю до события")
+    note['title'] = title
+    return note
+
+
+# CSV: колонки CSV_COLUMNS, дата ГГГГ-ММ-ДД или ДД.ММ.ГГГГ
+def parse_csv(lines):
+    # Возвращает пары (заметка, None) или (None, ошибка)
+    reader = csv.DictReader(lines)
+    for row in reader:
+        try:
+            yield _validate({
+                'title': row.get('title'),
+                'description': (row.get('description') or '').strip() or None,
+                'note_date': _parse_date(row.get('date') or ''),
+                'note_time': _parse_time(row.get('time') or ''),
+                'reminder_minutes': _parse_minutes(row.get('reminder_minutes') or ''),
+                'recurrence': _parse_recurrence(row.get('recurrence') or ''),
+            }), None
+        except ValueError as e:
+            yield None, f"строка {reader.line_num}: {e}"
+
+
+# iCalendar
+def _unfold(lines):
+    # Строки-продолжения начинаются с пробела или табуляции
+    current = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+def _unescape(value):
+    return re.sub(r'\\([\\;,nN])', lambda m: '\n' if m.group(1) in 'nN' else m.group(1), value)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _parse_datetime(value):
+    # (дата, время или None для события на весь день); время в UTC
+    # переводится в местное, TZID не учитывается - время берется как есть
+    value = value.strip()
+    if 'T' not in value:
+        return _parse_date(value), None
+    try:
+        moment = datetime.strptime(value.rstrip('Z')[:15], '%Y%m%dT%H%M%S')
+    except ValueError:
+        raise ValueError(f"неверная дата '{value}'")
+    if value.endswith('Z'):
+        moment = moment.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    return moment.strftime('%Y-%m-%d'), moment.strftime('%H:%M')
+
+
+def _trigger_minutes(value):
+    match = TRIGGER_RE.match(value.strip())
+    if not match:
+        return None
+    weeks, days, hours, minutes = (int(group or 0) for group in match.groups())
+    return ((weeks * 7 + days) * 24 + hours) * 60 + minutes
+
+
+def _ics_note(event):
+    if event.get('STATUS', '').upper() == 'CANCELLED':
+        return None
+    if 'RECURRENCE-ID' in event:
+        raise ValueError("измененные экземпляры серий не поддерживаются")
+    if 'DTSTART' not in event:
+        raise ValueError("нет DTSTART")
+    note_date, note_time = _parse_datetime(event['DTSTART'])
+    description = _unescape(event.get('DESCRIPTION', '')).strip() or None
+    if note_time and 'DTEND' in event and not description:
+        end_date, end_time = _parse_datetime(event['DTEND'])
+        if end_date == note_date and end_time and end_time != note_time:
+            description = f"До {end_time}"
+    return _validate({
+        'title': _unescape(event.get('SUMMARY', '')),
+        'description': description,
+        'note_date': note_date,
+        'note_time': note_time or ALL_DAY_TIME,
+        'reminder_minutes': event.get('TRIGGER'),
+        'recurrence': _parse_recurrence(event['RRULE']) if 'RRULE' in event else None,
+    })
+
+
+def parse_ics(lines):
+    # Возвращает пары (заметка, None) или (None, ошибка) по событиям VEVENT
+    event = None
+    number = 0
+    in_alarm = False
+    for line in _unfold(lines):
+        name_params, _, value = line.partition(':')
+        name = name_params.split(';', 1)[0].upper()
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            event = {}
+            number += 1
+        elif event is None:
+            continue
+        elif name == 'BEGIN' and value.upper() == 'VALARM':
+            in_alarm = True
+        elif name == 'END' and value.upper() == 'VALARM':
+            in_alarm = False
+        elif in_alarm:
+            # Из будильников берется первый заданный относительно начала
+            if name == 'TRIGGER' and 'TRIGGER' not in event:
+                event['TRIGGER'] = _trigger_minutes(value)
+        elif name == 'END' and value.upper() == 'VEVENT':
+            try:
+                note = _ics_note(event)
+                if note is not None:
+                    yield note, None
+            except ValueError as e:
+                yield None, f"событие {number} ({_unescape(event.get('SUMMARY', '')) or 'без названия'}): {e}"
+            event = None
+        elif name not in event:
+            event[name] = value
+
+
+PARSERS = {'.ics': parse_ics, '.csv': parse_csv}
+
+
+async def import_notes(storage, records, defaults, chunk_size=500, on_chunk=None):
+    # Заметки из records (пары парсера) вставляются пачками по chunk_size;
+    # defaults дополняет каждую (family_id, user_id...). on_chunk получает
+    # вставленные строки. Возвращает (число заметок, ошибки)
+    errors = []
+    imported = 0
+
+    def valid():
+        for note, error in records:
+            if error:
+                errors.append(error)
+            else:
+                # Все строки пачки с одинаковыми ключами: postgrest-py шлет
+                # объединение ключей, и пропущенный ключ стал бы NULL вместо
+                # умолчания колонки
+                if note['reminder_minutes'] is None:
+                    note = {**note, 'reminder_minutes': DEFAULT_REMINDER_MINUTES}
+                yield {**defaults, **note}
+
+    for chunk in chunks(valid(), chunk_size):
+        inserted = await storage.add_notes(chunk)
+        imported += len(chunk)
+        if on_chunk:
+            on_chunk(inserted)
+    return imported, errors
+
+
+# Экспорт
+def _fold(line):
+    # Строки длиннее 75 октетов переносятся, как требует RFC 5545
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    while encoded:
+        size = 75 if not parts else 74
+        # Не разрезать многобайтовый символ UTF-8
+        while size < len(encoded) and (encoded[size] & 0xC0) == 0x80:
+            size -= 1
+        parts.append(encoded[:size].decode('utf-8'))
+        encoded = encoded[size:]
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def ics_header(name):
+    return ''.join(_fold(line) for line in [
+        'BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Family Calendar//RU', 'CALSCALE:GREGORIAN',
+        f"X-WR-CALNAME:{_escape(name)}",
+    ])
+
+
+ICS_FOOTER = 'END:VCALENDAR\r\n'
+
+
+def ics_event(note, stamp):
+    start = datetime.strptime(f"{note['note_date']} {str(note['note_time'])[:5]}", '%Y-%m-%d %H:%M')
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:{note['id']}@family-calendar",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART:{start:%Y%m%dT%H%M%S}",
+        f"SUMMARY:{_escape(note['title'])}",
+    ]
+    if note.get('description'):
+        lines.append(f"DESCRIPTION:{_escape(note['description'])}")
+    if note.get('recurrence'):
+        lines.append(f"RRULE:{note['recurrence']}")
+    if note.get('reminder_minutes'):
+        lines += ['BEGIN:VALARM', 'ACTION:DISPLAY', f"DESCRIPTION:{_escape(note['title'])}",
+                  f"TRIGGER:-PT{note['reminder_minutes']}M", 'END:VALARM']
+    lines.append('END:VEVENT')
+    return ''.join(_fold(line) for line in lines)
+
+
+def csv_header():
+    return ','.join(CSV_COLUMNS) + '\r\n'
+
+
+def csv_rows(notes):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for note in notes:
+        writer.writerow([note['note_date'], str(note['note_time'])[:5], note['title'], note.get('description') or '',
+                         note.get('reminder_minutes') or '', note.get('recurrence') or ''])
+    return buffer.getvalue()
+
+
+async def stream_ics(storage, family_id, name):
+    # Части файла по мере чтения страниц заметок
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    yield ics_header(name)
+    async for page in storage.iter_family_notes(family_id):
+        yield ''.join(ics_event(note, stamp) for note in page)
+    yield ICS_FOOTER
+
+
+async def stream_csv(storage, family_id):
+    yield csv_header()
+    async for page in storage.iter_family_notes(family_id):
+        yield csv_rows(page)
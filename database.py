@@ -1,13 +1,206 @@
+import calendar
+import hashlib
+import queue
+import re
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
+from metrics import register_cache
+from recurrence import OccurrenceCache, occurrences
+
+# Миграции схемы: номер миграции хранится в PRAGMA user_version,
+# при открытии базы применяются все еще не выполненные.
+MIGRATIONS = [
+    # 1: индексы для выборок заметок по семье и дате
+    [
+        'CREATE INDEX IF NOT EXISTS idx_notes_family_date ON notes (family_id, note_date, note_time)',
+        'CREATE INDEX IF NOT EXISTS idx_notes_date ON notes (note_date, note_time)',
+        'CREATE INDEX IF NOT EXISTS idx_users_family ON users (family_id)',
+    ],
+    # 2: полнотекстовый индекс по заголовку и описанию, unicode61 понимает кириллицу.
+    # family_id тоже индексируется, чтобы отбор по семье выполнялся внутри FTS
+    [
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+            title, content, family_id, content='notes', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )''',
+        '''CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+            INSERT INTO notes_fts (rowid, title, content, family_id) VALUES (new.id, new.title, new.content, new.family_id);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, title, content, family_id) VALUES ('delete', old.id, old.title, old.content, old.family_id);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE OF title, content, family_id ON notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, title, content, family_id) VALUES ('delete', old.id, old.title, old.content, old.family_id);
+            INSERT INTO notes_fts (rowid, title, content, family_id) VALUES (new.id, new.title, new.content, new.family_id);
+        END''',
+        "INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')",
+    ],
+    # 3: время напоминания как вычисляемая колонка и состояние доставки.
+    # Частичный индекс содержит только еще не отправленные напоминания,
+    # уже прошедшие заметки помечаются отправленными
+    [
+        '''ALTER TABLE notes ADD COLUMN remind_at TEXT GENERATED ALWAYS AS (
+            datetime(note_date || ' ' || note_time, '-' || reminder_minutes || ' minutes')
+        ) VIRTUAL''',
+        'ALTER TABLE notes ADD COLUMN reminded_at TIMESTAMP',
+        "UPDATE notes SET reminded_at = datetime('now', 'localtime') WHERE remind_at <= datetime('now', 'localtime')",
+        'CREATE INDEX IF NOT EXISTS idx_notes_remind_at ON notes (remind_at) WHERE reminded_at IS NULL',
+    ],
+    # 4: повторяющиеся события - одна строка на серию с правилом RRULE
+    [
+        'ALTER TABLE notes ADD COLUMN recurrence TEXT',
+        'CREATE INDEX IF NOT EXISTS idx_notes_series ON notes (family_id, note_date) WHERE recurrence IS NOT NULL',
+    ],
+    # 5: координация рассылки напоминаний между процессами (reminder_worker.py):
+    # аренда шардов и однократный захват каждого напоминания
+    [
+        '''CREATE TABLE IF NOT EXISTS reminder_leases (
+            shard INTEGER PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at TEXT NOT NULL
+        )''',
+        '''CREATE TABLE IF NOT EXISTS reminder_claims (
+            reminder_id TEXT PRIMARY KEY,
+            note_date TEXT NOT NULL,
+            owner TEXT NOT NULL,
+            claimed_at TEXT NOT NULL
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_reminder_claims_date ON reminder_claims (note_date)',
+    ],
+    # 6: отправленные напоминания учитываются только в reminder_claims;
+    # отметки reminded_at последних дней переносятся туда
+    [
+        '''INSERT OR IGNORE INTO reminder_claims (reminder_id, note_date, owner, claimed_at)
+           SELECT CAST(id AS TEXT), note_date, 'migration', reminded_at FROM notes
+           WHERE reminded_at IS NOT NULL AND note_date >= date('now', 'localtime', '-2 days')''',
+        'DROP INDEX IF EXISTS idx_notes_remind_at',
+        'ALTER TABLE notes DROP COLUMN reminded_at',
+        'CREATE INDEX IF NOT EXISTS idx_notes_remind_at ON notes (remind_at)',
+    ],
+    # 7: напоминания рассылает планировщик по note_date (idx_notes_date),
+    # remind_at и его индекс больше не нужны
+    [
+        'DROP INDEX IF EXISTS idx_notes_remind_at',
+        'ALTER TABLE notes DROP COLUMN remind_at',
+    ],
+]
+
+def reminder_shard(family_id, shards):
+    # Шард семьи для рассылки напоминаний несколькими процессами. md5 не
+    # зависит от PYTHONHASHSEED и доступен в Postgres: та же функция есть в
+    # supabase/reminder_delivery.sql
+    return int(hashlib.md5(str(family_id).encode()).hexdigest()[:8], 16) % shards
+
+def configure_connection(conn):
+    # WAL: читатели не блокируют писателя, fsync только на контрольных точках
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.create_function('reminder_shard', 2, reminder_shard, deterministic=True)
+
+# Пул соединений: несколько читателей и одно соединение для записи,
+# доступ к которому сериализуется блокировкой.
+class ConnectionPool:
+    def __init__(self, db_name, readers=4):
+        self.db_name = db_name
+        self.readers = readers if db_name != ':memory:' else 0
+        self._writer = self._connect()
+        self._write_lock = threading.RLock()
+        self._readers = queue.Queue()
+        # У базы в памяти у каждого соединения своя копия, читаем через писателя
+        for _ in range(self.readers):
+            self._readers.put(self._connect())
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        configure_connection(conn)
+        return conn
+    
+    @contextmanager
+    def reader(self):
+        if self.db_name == ':memory:':
+            with self.writer() as conn:
+                yield conn
+            return
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+    
+    @contextmanager
+    def writer(self):
+        with self._write_lock:
+            yield self._writer
+    
+    def close(self):
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+        with self._write_lock:
+            self._writer.close()
+
 class Database:
-    def __init__(self, db_name='family_notes.db'):
-        self.conn = sqlite3.connect(db_name, check_same_thread=False)
+    def __init__(self, db_name='family_notes.db', readers=4):
+        self.pool = ConnectionPool(db_name, readers)
+        self._transaction_depth = 0
+        self._occurrences = OccurrenceCache()
+        register_cache('occurrences', self._occurrences)
         self.create_tables()
+        
+        # Позиции колонок в строках n.* для подстановки дат экземпляров серий
+        with self.pool.writer() as conn:
+            columns = [row[1] for row in conn.execute('PRAGMA table_xinfo(notes)')]
+        self.note_columns = columns
+        self._user_column = columns.index('user_id')
+        self._date_column = columns.index('note_date')
+        self._time_column = columns.index('note_time')
+        self._important_column = columns.index('is_important')
+        self._recurrence_column = columns.index('recurrence')
+    
+    def close(self):
+        self.pool.close()
+    
+    @contextmanager
+    def transaction(self):
+        # Все записи внутри блока фиксируются одним коммитом; писатель занят
+        # до конца блока, поэтому глубина меняется только под его блокировкой
+        with self.pool.writer() as conn:
+            self._transaction_depth += 1
+            try:
+                yield self
+            except Exception:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0:
+                    conn.rollback()
+                raise
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                conn.commit()
+    
+    def _fetchall(self, query, params=()):
+        with self.pool.reader() as conn:
+            return conn.execute(query, params).fetchall()
+    
+    def _fetchone(self, query, params=()):
+        with self.pool.reader() as conn:
+            return conn.execute(query, params).fetchone()
+    
+    def _write(self, query, params=()):
+        with self.pool.writer() as conn:
+            cursor = conn.execute(query, params)
+            if self._transaction_depth == 0:
+                conn.commit()
+            return cursor
     
     def create_tables(self):
-        cursor = self.conn.cursor()
+        with self.pool.writer() as conn:
+            self._create_tables(conn)
+        self.migrate()
+    
+    def _create_tables(self, conn):
+        cursor = conn.cursor()
         
         # Таблица семей
         cursor.execute('''
@@ -53,82 +246,130 @@ class Database:
             )
         ''')
         
-        self.conn.commit()
+        conn.commit()
+    
+    def migrate(self):
+        # Каждая миграция - отдельная транзакция BEGIN IMMEDIATE. sqlite3 сам
+        # не открывает транзакцию перед DDL, поэтому управление ручное
+        # (isolation_level=None): упавшая миграция откатывается целиком, а
+        # процессы, открывающие базу одновременно, применяют миграции по
+        # очереди - версия перечитывается уже под блокировкой записи
+        with self.pool.writer() as conn:
+            isolation_level = conn.isolation_level
+            conn.isolation_level = None
+            try:
+                while True:
+                    conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        version = conn.execute('PRAGMA user_version').fetchone()[0]
+                        if version < len(MIGRATIONS):
+                            for statement in MIGRATIONS[version]:
+                                conn.execute(statement)
+                            conn.execute(f'PRAGMA user_version = {version + 1}')
+                    except BaseException:
+                        conn.execute('ROLLBACK')
+                        raise
+                    conn.execute('COMMIT')
+                    if version >= len(MIGRATIONS):
+                        break
+            finally:
+                conn.isolation_level = isolation_level
     
     # Методы для работы с пользователями
-    def add_user(self, user_id, username, full_name, family_id, role='member'):
-        cursor = self.conn.cursor()
+    def add_user(self, user_id, username, full_name, family_id, role='member', avatar_color=None):
         # Генерируем цвет для аватара
         import hashlib
         colors = ['#2196F3', '#4CAF50', '#FF9800', '#F44336', '#9C27B0', '#00BCD4']
         color_index = hash(str(user_id)) % len(colors)
         
-        cursor.execute('''
+        self._write('''
             INSERT OR REPLACE INTO users (user_id, username, full_name, family_id, role, avatar_color)
             VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, username, full_name, family_id, role, colors[color_index]))
-        self.conn.commit()
+        ''', (user_id, username, full_name, family_id, role, avatar_color or colors[color_index]))
     
     def get_user_family(self, user_id):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT u.family_id, f.family_name, u.role, u.avatar_color, f.color_theme
+        return self._fetchone('''
+            SELECT u.family_id, f.family_name, u.role, u.avatar_color, f.color_theme, f.family_code
             FROM users u
             LEFT JOIN families f ON u.family_id = f.id
             WHERE u.user_id = ?
         ''', (user_id,))
-        return cursor.fetchone()
     
     def get_family_members(self, family_id):
-        cursor = self.conn.cursor()
-        cursor.execute('''
+        return self._fetchall('''
             SELECT user_id, full_name, role, avatar_color 
             FROM users 
             WHERE family_id = ?
             ORDER BY role DESC, full_name
         ''', (family_id,))
-        return cursor.fetchall()
+    
+    def get_members(self, family_ids):
+        # (user_id, family_id) участников сразу нескольких семей
+        placeholders = ', '.join('?' * len(family_ids))
+        return self._fetchall(f'SELECT user_id, family_id FROM users WHERE family_id IN ({placeholders})',
+                              tuple(family_ids))
     
     # Методы для работы с семьями
-    def create_family(self, family_code, family_name):
-        cursor = self.conn.cursor()
+    def create_family(self, family_code, family_name, color_theme=None):
         # Генерируем случайный цвет для темы семьи
         import random
         colors = ['#4CAF50', '#2196F3', '#FF9800', '#9C27B0', '#00BCD4', '#FF5722']
         
-        cursor.execute('''
+        cursor = self._write('''
             INSERT INTO families (family_code, family_name, color_theme, created_at)
             VALUES (?, ?, ?, ?)
-        ''', (family_code, family_name, random.choice(colors), datetime.now()))
-        self.conn.commit()
+        ''', (family_code, family_name, color_theme or random.choice(colors), datetime.now()))
         return cursor.lastrowid
     
     def get_family_by_code(self, family_code):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT id, family_name, color_theme FROM families WHERE family_code = ?', (family_code,))
-        return cursor.fetchone()
+        return self._fetchone('SELECT id, family_name, color_theme FROM families WHERE family_code = ?', (family_code,))
     # Методы для заметок
     def add_note(self, user_id, family_id, title, content, note_date, note_time, 
-                 reminder_minutes=30, is_important=False, color_tag=None):
-        cursor = self.conn.cursor()
-        
+                 reminder_minutes=30, is_important=False, color_tag=None, recurrence=None):
         if not color_tag:
-            colors = ['#FF9800', '#4CAF50', '#2196F3', '#9C27B0', '#FF5722']
-            color_index = hash(f"{title}{datetime.now()}") % len(colors)
-            color_tag = colors[color_index]
+            color_tag = self._pick_note_color(title)
         
-        cursor.execute('''
+        cursor = self._write('''
             INSERT INTO notes (user_id, family_id, title, content, note_date, note_time, 
-                             reminder_minutes, is_important, color_tag, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                             reminder_minutes, is_important, color_tag, created_at, recurrence)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (user_id, family_id, title, content, note_date, note_time, 
-              reminder_minutes, is_important, color_tag, datetime.now()))
-        self.conn.commit()
+              reminder_minutes, is_important, color_tag, datetime.now(), recurrence))
+        if recurrence:
+            self._occurrences.invalidate(family_id)
         return cursor.lastrowid
     
+    def add_notes(self, notes):
+        # Массовая вставка одним коммитом; возвращает id вставленных заметок
+        # в порядке notes
+        now = datetime.now()
+        rows = [
+            (note['user_id'], note['family_id'], note['title'], note.get('content'),
+             note['note_date'], note['note_time'], note.get('reminder_minutes', 30),
+             note.get('is_important', False), note.get('color_tag') or self._pick_note_color(note['title']), now,
+             note.get('recurrence'))
+            for note in notes
+        ]
+        with self.transaction(), self.pool.writer() as conn:
+            ids = [
+                conn.execute('''
+                    INSERT INTO notes (user_id, family_id, title, content, note_date, note_time, 
+                                     reminder_minutes, is_important, color_tag, created_at, recurrence)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', row).lastrowid
+                for row in rows
+            ]
+        for family_id in {note['family_id'] for note in notes if note.get('recurrence')}:
+            self._occurrences.invalidate(family_id)
+        return ids
+    
+    @staticmethod
+    def _pick_note_color(title):
+        colors = ['#FF9800', '#4CAF50', '#2196F3', '#9C27B0', '#FF5722']
+        color_index = hash(f"{title}{datetime.now()}") % len(colors)
+        return colors[color_index]
+    
     def get_family_notes(self, family_id, date=None, user_id=None):
-        cursor = self.conn.cursor()
-        
         query = '''
             SELECT n.*, u.full_name as author_name, u.avatar_color
             FROM notes n
@@ -147,90 +388,202 @@ class Database:
         
         query += ' ORDER BY n.is_important DESC, n.note_date, n.note_time'
         
-        cursor.execute(query, tuple(params))
-        return cursor.fetchall()
-    
-    def get_today_notes(self, family_id):
-        cursor = self.conn.cursor()
-        today = datetime.now().strftime('%Y-%m-%d')
+        rows = self._fetchall(query, tuple(params))
+        if not date:
+            return rows
         
-        cursor.execute('''
+        # На конкретную дату строки серий заменяются их экземплярами
+        rows = [row for row in rows if not row[self._recurrence_column]]
+        series = [row for row in self._series_occurrences(family_id, date, date)
+                  if not user_id or row[self._user_column] == user_id]
+        if not series:
+            return rows
+        return sorted(rows + series, key=lambda row: (-row[self._important_column], row[self._date_column], row[self._time_column]))
+    
+    @staticmethod
+    def _shard_filter(shards):
+        # shards - (номера шардов, число шардов), см. reminder_shard
+        owned, count = shards
+        placeholders = ', '.join('?' * len(owned))
+        return f' AND reminder_shard(n.family_id, ?) IN ({placeholders})', [count, *owned]
+    
+    def get_series(self, end_date, family_id=None, after_id=None, shards=None):
+        # Строки серий, начавшихся не позже end_date: одной семьи или всех;
+        # after_id оставляет только созданные после заметки after_id,
+        # shards - только семьи этих шардов
+        if shards is not None and not shards[0]:
+            return []
+        query = '''
             SELECT n.*, u.full_name as author_name, u.avatar_color
             FROM notes n
             LEFT JOIN users u ON n.user_id = u.user_id
-            WHERE n.family_id = ? AND n.note_date = ?
-            ORDER BY n.note_time
-        ''', (family_id, today))
-        return cursor.fetchall()
+            WHERE n.recurrence IS NOT NULL
+            AND n.note_date <= ?
+        '''
+        params = [end_date]
+        if family_id is not None:
+            query += ' AND n.family_id = ?'
+            params.append(family_id)
+        if after_id is not None:
+            query += ' AND n.id > ?'
+            params.append(after_id)
+        if shards is not None:
+            condition, shard_params = self._shard_filter(shards)
+            query += condition
+            params += shard_params
+        return self._fetchall(query, tuple(params))
     
-    def get_upcoming_notes(self, family_id, days=7):
-        cursor = self.conn.cursor()
-        today = datetime.now().strftime('%Y-%m-%d')
-        future_date = (datetime.now() + timedelta(days=days)).strftime('%Y-%m-%d')
-        
-        cursor.execute('''
+    def get_day_notes(self, date, end_date=None, after_id=None, shards=None):
+        # Разовые заметки всех семей на день или по end_date включительно,
+        # для планировщика напоминаний; after_id и shards - как в get_series
+        if shards is not None and not shards[0]:
+            return []
+        query = '''
             SELECT n.*, u.full_name as author_name, u.avatar_color
             FROM notes n
             LEFT JOIN users u ON n.user_id = u.user_id
-            WHERE n.family_id = ? 
-            AND n.note_date BETWEEN ? AND ?
-            ORDER BY n.note_date, n.note_time
-        ''', (family_id, today, future_date))
-        return cursor.fetchall()
+            WHERE n.note_date BETWEEN ? AND ? AND n.recurrence IS NULL
+        '''
+        params = [date, end_date or date]
+        if after_id is not None:
+            query += ' AND n.id > ?'
+            params.append(after_id)
+        if shards is not None:
+            condition, shard_params = self._shard_filter(shards)
+            query += condition
+            params += shard_params
+        return self._fetchall(query + ' ORDER BY n.note_date, n.note_time', tuple(params))
     
-    def get_month_notes(self, family_id, year, month):
-        cursor = self.conn.cursor()
-        start_date = f"{year}-{month:02d}-01"
+    def get_last_note_id(self):
+        return self._fetchone('SELECT coalesce(max(id), 0) FROM notes')[0]
+    
+    def get_family_notes_page(self, family_id, after_id=None, limit=500):
+        # Страница заметок семьи по возрастанию id, после заметки after_id
+        return self._fetchall('''
+            SELECT n.*, u.full_name as author_name, u.avatar_color
+            FROM notes n
+            LEFT JOIN users u ON n.user_id = u.user_id
+            WHERE n.family_id = ? AND n.id > ?
+            ORDER BY n.id
+            LIMIT ?
+        ''', (family_id, after_id if after_id is not None else 0, limit))
+    
+    def _series_occurrences(self, family_id, start_date, end_date):
+        # Экземпляры всех серий семьи в окне [start_date, end_date]; стоимость
+        # зависит от числа серий, а не от числа экземпляров в истории
+        cached = self._occurrences.get(family_id, start_date, end_date)
+        if cached is not None:
+            return cached
         
-        if month == 12:
-            end_date = f"{year+1}-01-01"
-        else:
-            end_date = f"{year}-{month+1:02d}-01"
+        series = self.get_series(end_date, family_id)
         
-        cursor.execute('''
+        column = self._date_column
+        result = []
+        for row in series:
+            for day in occurrences(row[self._recurrence_column], row[column], start_date, end_date):
+                result.append(row[:column] + (day.strftime('%Y-%m-%d'),) + row[column + 1:])
+        
+        self._occurrences.set(family_id, start_date, end_date, result)
+        return result
+    
+    def _notes_in_window(self, family_id, start_date, end_date):
+        rows = self._fetchall('''
             SELECT n.*, u.full_name as author_name, u.avatar_color
             FROM notes n
             LEFT JOIN users u ON n.user_id = u.user_id
             WHERE n.family_id = ? 
-            AND n.note_date >= ? AND n.note_date < ?
+            AND n.note_date BETWEEN ? AND ?
+            AND n.recurrence IS NULL
             ORDER BY n.note_date, n.note_time
         ''', (family_id, start_date, end_date))
-        return cursor.fetchall()
+        
+        series = self._series_occurrences(family_id, start_date, end_date)
+        if not series:
+            return rows
+        return sorted(rows + series, key=lambda row: (row[self._date_column], row[self._time_column]))
+    
+    def get_today_notes(self, family_id):
+        today = datetime.now().strftime('%Y-%m-%d')
+        
+        return self._notes_in_window(family_id, today, today)
+    
+    def get_upcoming_notes(self, family_id, days=7):
+        today = datetime.now().strftime('%Y-%m-%d')
+        future_date = (datetime.now() + timedelta(days=days)).strftime('%Y-%m-%d')
+        
+        return self._notes_in_window(family_id, today, future_date)
+    
+    def get_month_notes(self, family_id, year, month):
+        start_date = f"{year}-{month:02d}-01"
+        end_date = f"{year}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}"
+        
+        return self._notes_in_window(family_id, start_date, end_date)
     
     def delete_note(self, note_id, user_id):
-        cursor = self.conn.cursor()
-        cursor.execute('DELETE FROM notes WHERE id = ? AND user_id = ?', (note_id, user_id))
-        self.conn.commit()
+        cursor = self._write('DELETE FROM notes WHERE id = ? AND user_id = ?', (note_id, user_id))
+        self._occurrences.invalidate()
         return cursor.rowcount > 0
     
     def update_note_color(self, note_id, color):
-        cursor = self.conn.cursor()
-        cursor.execute('UPDATE notes SET color_tag = ? WHERE id = ?', (color, note_id))
-        self.conn.commit()
+        self._write('UPDATE notes SET color_tag = ? WHERE id = ?', (color, note_id))
+        self._occurrences.invalidate()
     
-    def search_notes(self, family_id, search_text):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT n.*, u.full_name as author_name, u.avatar_color
-            FROM notes nLEFT JOIN users u ON n.user_id = u.user_id
-            WHERE n.family_id = ? 
-            AND (n.title LIKE ? OR n.content LIKE ?)
-            ORDER BY n.note_date, n.note_time
-        ''', (family_id, f'%{search_text}%', f'%{search_text}%'))
-        return cursor.fetchall()
+    def search_notes(self, family_id, search_text, limit=50):
+        # Каждое слово ищется как префикс: "забр дет" найдет "Забрать детей"
+        words = re.findall(r'\w+', search_text)
+        if not words:
+            return []
+        terms = ' '.join(f'"{word}"*' for word in words)
+        match = f'family_id : "{family_id}" AND {{title content}} : ({terms})'
+        
+        return self._fetchall('''
+            SELECT n.*, u.full_name as author_name, u.avatar_color,
+                   highlight(notes_fts, 0, '<b>', '</b>') as title_highlight,
+                   snippet(notes_fts, 1, '<b>', '</b>', '…', 10) as snippet
+            FROM notes_fts
+            JOIN notes n ON n.id = notes_fts.rowid
+            LEFT JOIN users u ON n.user_id = u.user_id
+            WHERE notes_fts MATCH ? AND n.family_id = ?
+            ORDER BY notes_fts.rank
+            LIMIT ?
+        ''', (match, family_id, limit))
     
-    def get_notes_for_reminder(self):
-        cursor = self.conn.cursor()
+    # Координация рассылки напоминаний между процессами (reminder_worker.py)
+    def acquire_reminder_leases(self, owner, shards, ttl):
+        # Продлевает свои аренды и забирает свободные или просроченные;
+        # запись сериализуется блокировкой SQLite, в том числе между процессами
         now = datetime.now()
-        current_date = now.strftime('%Y-%m-%d')
-        current_time = now.strftime('%H:%M')
-        
-        cursor.execute('''
-            SELECT n.*, u.user_id, u.full_name, f.family_name
-            FROM notes n
-            JOIN users u ON n.user_id = u.user_id
-            JOIN families f ON n.family_id = f.id
-            WHERE n.note_date = ? 
-            AND TIME(n.note_time, '-'  n.reminder_minutes  ' minutes') <= TIME(?)
-        ''', (current_date, current_time))
-        return cursor.fetchall()
\ No newline at end of file
+        expires_at = (now + timedelta(seconds=ttl)).strftime('%Y-%m-%d %H:%M:%S')
+        owned = []
+        with self.transaction(), self.pool.writer() as conn:
+            for shard in shards:
+                cursor = conn.execute('''
+                    INSERT INTO reminder_leases (shard, owner, expires_at) VALUES (?, ?, ?)
+                    ON CONFLICT (shard) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                    WHERE reminder_leases.owner = excluded.owner OR reminder_leases.expires_at < ?
+                ''', (shard, owner, expires_at, now.strftime('%Y-%m-%d %H:%M:%S')))
+                if cursor.rowcount:
+                    owned.append(shard)
+        return owned
+    
+    def release_reminder_leases(self, owner):
+        self._write('DELETE FROM reminder_leases WHERE owner = ?', (owner,))
+    
+    def claim_reminders(self, reminders, owner):
+        # reminders - тройки (reminder_id, id заметки, note_date); возвращает id
+        # захваченных этим вызовом. Напоминания удаленных заметок не
+        # захватываются. Захваты старше двух дней удаляются: сработавшие
+        # напоминания с ними уже не совпадут
+        now = datetime.now()
+        claimed = []
+        with self.transaction(), self.pool.writer() as conn:
+            conn.execute('DELETE FROM reminder_claims WHERE note_date < ?',
+                         ((now - timedelta(days=2)).strftime('%Y-%m-%d'),))
+            for reminder_id, note_id, note_date in reminders:
+                cursor = conn.execute('''
+                    INSERT OR IGNORE INTO reminder_claims (reminder_id, note_date, owner, claimed_at)
+                    SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM notes WHERE id = ?)
+                ''', (reminder_id, note_date, owner, now.strftime('%Y-%m-%d %H:%M:%S'), note_id))
+                if cursor.rowcount:
+                    claimed.append(reminder_id)
+        return claimed
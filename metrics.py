@@ -0,0 +1,264 @@
+import contextvars
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Метрики в текстовом формате Prometheus без внешних зависимостей.
+# Значения меняются из цикла событий и из потоков пулов БД, поэтому
+# каждая метрика защищена своей блокировкой.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._functions = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labels)
+
+    def set_function(self, function, **labels):
+        # Значение вычисляется при каждом чтении /metrics
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                items.append((key, function()))
+            except Exception:
+                logging.exception(f"Ошибка вычисления метрики {self.name}")
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, help, labels, registry)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, key, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+# Все метрики приложения
+HANDLER_SECONDS = Histogram('bot_handler_seconds', 'Время обработки сообщения', ('handler',))
+HANDLER_ERRORS = Counter('bot_handler_errors_total', 'Исключения в обработчиках', ('handler',))
+HANDLER_QUERIES = Histogram('bot_handler_queries', 'Запросов к БД за одно сообщение', ('handler',),
+                            buckets=COUNT_BUCKETS)
+
+QUERY_SECONDS = Histogram('db_query_seconds', 'Время запроса к БД', ('backend', 'query'))
+QUERY_ERRORS = Counter('db_query_errors_total', 'Неудачные запросы к БД', ('backend', 'query'))
+
+SCHEDULER_TICK_SECONDS = Histogram('scheduler_tick_seconds', 'Длительность такта планировщика')
+SCHEDULER_FIRE_SECONDS = Histogram('scheduler_fire_seconds', 'Время рассылки пачки напоминаний')
+SCHEDULER_LAG_SECONDS = Histogram('scheduler_lag_seconds', 'Опоздание напоминания относительно срока')
+SCHEDULER_FIRED = Counter('scheduler_reminders_fired_total', 'Сработавшие напоминания')
+SCHEDULER_ERRORS = Counter('scheduler_errors_total', 'Ошибки в такте планировщика')
+SCHEDULER_PENDING = Gauge('scheduler_pending_reminders', 'Напоминания в очереди планировщика')
+SCHEDULER_HEAP = Gauge('scheduler_heap_size', 'Записи в куче планировщика, включая устаревшие')
+
+SEND_TOTAL = Counter('telegram_send_total', 'Результаты отправки сообщений', ('result',))
+SEND_RETRIES = Counter('telegram_send_retries_total', 'Повторы отправки', ('reason',))
+SEND_LATENCY_SECONDS = Histogram('telegram_send_latency_seconds', 'Время от постановки в очередь до отправки')
+SEND_QUEUE = Gauge('telegram_send_queue', 'Сообщения в очереди отправки')
+
+CACHE_ENTRIES = Gauge('cache_entries', 'Записи в кэше', ('cache',))
+CACHE_HITS = Counter('cache_hits_total', 'Попадания в кэш', ('cache',))
+CACHE_MISSES = Counter('cache_misses_total', 'Промахи кэша', ('cache',))
+
+
+def register_cache(name, cache):
+    # Счетчики кэша с методом stats() (TTLCache, OccurrenceCache) читаются
+    # при каждом запросе /metrics
+    CACHE_ENTRIES.set_function(lambda: cache.stats()['size'], cache=name)
+    CACHE_HITS.set_function(lambda: cache.stats()['hits'], cache=name)
+    CACHE_MISSES.set_function(lambda: cache.stats()['misses'], cache=name)
+
+# Счетчик запросов текущего обработчика; задачи, созданные обработчиком,
+# наследуют контекст и увеличивают тот же счетчик
+_handler_queries = contextvars.ContextVar('handler_queries', default=None)
+
+
+@contextmanager
+def track_query(backend, query):
+    counter = _handler_queries.get()
+    if counter is not None:
+        counter[0] += 1
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        QUERY_ERRORS.inc(backend=backend, query=query)
+        raise
+    finally:
+        QUERY_SECONDS.observe(time.perf_counter() - started, backend=backend, query=query)
+
+
+# Middleware aiogram: время, ошибки и число запросов к БД по обработчикам.
+# name_of(event, callback) позволяет подписать обработчик точнее имени функции.
+class HandlerMetrics:
+    def __init__(self, name_of=None):
+        self.name_of = name_of or (lambda event, callback: callback.__name__)
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get('handler')
+        name = self.name_of(event, handler_object.callback) if handler_object else 'unknown'
+        queries = [0]
+        token = _handler_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            _handler_queries.reset(token)
+            HANDLER_SECONDS.observe(time.perf_counter() - started, handler=name)
+            HANDLER_QUERIES.observe(queries[0], handler=name)
+
+
+# Выборочное профилирование: профилируется доля sample_rate тактов, профили
+# тактов дольше threshold секунд сохраняются в directory для snakeviz/pstats.
+# cProfile видит весь поток, поэтому в профиль попадают и другие задачи цикла.
+class SlowTickProfiler:
+    def __init__(self, directory=None, threshold=1.0, sample_rate=0.1):
+        self.directory = directory
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.dumped = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def profile(self, name):
+        if not self.directory or random.random() >= self.sample_rate:
+            yield
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # В процессе уже работает другой профилировщик
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.threshold:
+                path = os.path.join(
+                    self.directory, f"{name}-{datetime.now():%Y%m%d-%H%M%S}-{elapsed * 1000:.0f}ms.prof"
+                )
+                profiler.dump_stats(path)
+                self.dumped += 1
+                logging.warning(f"Медленный такт {name}: {elapsed:.2f} с, профиль сохранен в {path}")
@@ -0,0 +1,190 @@
+import re
+from datetime import date, datetime, timedelta
+
+from recurrence import RRULE_DAYS
+from scheduler import MAX_REMINDER_MINUTES
+
+# Разбор быстрых заметок: "завтра 18:00-19:30 Футбол напомнить за 15 минут".
+# Каждая непустая строка сообщения - отдельная заметка; строка только с датой
+# ("завтра:") задает дату для следующих строк.
+
+WEEKDAYS = {
+    'понедельник': 0, 'пн': 0,
+    'вторник': 1, 'вт': 1,
+    'среду': 2, 'среда': 2, 'ср': 2,
+    'четверг': 3, 'чт': 3,
+    'пятницу': 4, 'пятница': 4, 'пт': 4,
+    'субботу': 5, 'суббота': 5, 'сб': 5,
+    'воскресенье': 6, 'вс': 6,
+}
+
+MONTHS = {
+    'января': 1, 'февраля': 2, 'марта': 3, 'апреля': 4, 'мая': 5, 'июня': 6,
+    'июля': 7, 'августа': 8, 'сентября': 9, 'октября': 10, 'ноября': 11, 'декабря': 12,
+}
+
+RELATIVE_DAYS = {'сегодня': 0, 'завтра': 1, 'послезавтра': 2}
+
+RECURRENCE_WORDS = {
+    'ежедневно': 'FREQ=DAILY', 'каждый день': 'FREQ=DAILY',
+    'еженедельно': 'FREQ=WEEKLY', 'каждую неделю': 'FREQ=WEEKLY',
+    'ежемесячно': 'FREQ=MONTHLY', 'каждый месяц': 'FREQ=MONTHLY',
+}
+
+UNIT_MINUTES = {'мин': 1, 'час': 60, 'ч': 60, 'день': 1440, 'дня': 1440, 'дней': 1440}
+
+_weekday_names = '|'.join(sorted(WEEKDAYS, key=len, reverse=True))
+_month_names = '|'.join(MONTHS)
+
+TIME_RE = re.compile(r'(?<![\d:.])(?:\bв\s+)?(\d{1,2}):(\d{2})(?:\s*[-–—]\s*(\d{1,2}):(\d{2}))?(?![\d:])', re.I)
+REMINDER_RE = re.compile(r'(?:\bнапомнить\s+)?\bза\s+(\d+)\s*(мин\w*|час\w*|ч\b|день|дня|дней)', re.I)
+RECURRENCE_RE = re.compile(
+    rf'\b(?:ежедневно|каждый\s+день|еженедельно|каждую\s+неделю|ежемесячно|каждый\s+месяц'
+    rf'|кажд(?:ый|ую|ое)\s+(?:{_weekday_names}))\b',
+    re.I
+)
+RELATIVE_RE = re.compile(r'\b(послезавтра|завтра|сегодня)\b', re.I)
+WEEKDAY_RE = re.compile(rf'\b(?:в|во)\s+({_weekday_names})\b', re.I)
+NUMERIC_DATE_RE = re.compile(r'(?<![\d:.])(0?[1-9]|[12]\d|3[01])\.(0[1-9]|1[0-2])(?:\.(\d{4}|\d{2}))?(?![\d.]|:\d)')
+TEXT_DATE_RE = re.compile(rf'\b(\d{{1,2}})\s+({_month_names})\b', re.I)
+SPACES_RE = re.compile(r'\s+')
+TRIM_RE = re.compile(r'^[\s,.:;–—-]+|[\s,.:;–—-]+$')
+
+
+def _valid_time(hours, minutes):
+    hours, minutes = int(hours), int(minutes)
+    if hours > 23 or minutes > 59:
+        return None
+    return f"{hours:02d}:{minutes:02d}"
+
+
+def _next_weekday(today, weekday):
+    days_ahead = (weekday - today.weekday()) % 7 or 7
+    return today + timedelta(days=days_ahead)
+
+
+def _recurrence(text):
+    text = text.lower()
+    if text in RECURRENCE_WORDS:
+        return RECURRENCE_WORDS[text]
+    weekday = WEEKDAYS[text.split()[-1]]
+    return f'FREQ=WEEKLY;BYDAY={RRULE_DAYS[weekday]}'
+
+
+def _parse_date(text, today):
+    # Возвращает (дата, span) первого найденного указания даты или (None, None)
+    match = RELATIVE_RE.search(text)
+    if match:
+        return today + timedelta(days=RELATIVE_DAYS[match.group(1).lower()]), match.span()
+
+    match = WEEKDAY_RE.search(text)
+    if match:
+        return _next_weekday(today, WEEKDAYS[match.group(1).lower()]), match.span()
+
+    match = NUMERIC_DATE_RE.search(text)
+    if match:
+        day, month, year = match.groups()
+        return _build_date(today, int(day), int(month), year), match.span()
+
+    match = TEXT_DATE_RE.search(text)
+    if match:
+        return _build_date(today, int(match.group(1)), MONTHS[match.group(2).lower()], None), match.span()
+
+    return None, None
+
+
+def _build_date(today, day, month, year):
+    try:
+        if year:
+            year = int(year)
+            return date(year + 2000 if year < 100 else year, month, day)
+        result = date(today.year, month, day)
+        # Без года берется ближайшая будущая дата
+        if result < today:
+            result = date(today.year + 1, month, day)
+        return result
+    except ValueError:
+        return None
+
+
+def _cut(text, span):
+    return text[:span[0]] + ' ' + text[span[1]:]
+
+
+def parse_line(line, default_date, today=None):
+    # Возвращает словарь заметки, ('date', дата) если строка содержит только
+    # дату, или None, если время не указано или указано неверно либо срок
+    # напоминания больше MAX_REMINDER_MINUTES
+    today = today or default_date
+    text = line
+    note = {
+        'note_date': default_date,
+        'note_time': None,
+        'end_time': None,
+        'recurrence': None,
+        'reminder_minutes': None,
+    }
+
+    match = REMINDER_RE.search(text)
+    if match:
+        unit = next(u for u in UNIT_MINUTES if match.group(2).lower().startswith(u))
+        note['reminder_minutes'] = int(match.group(1)) * UNIT_MINUTES[unit]
+        if note['reminder_minutes'] > MAX_REMINDER_MINUTES:
+            return None
+        text = _cut(text, match.span())
+
+    match = RECURRENCE_RE.search(text)
+    if match:
+        note['recurrence'] = _recurrence(SPACES_RE.sub(' ', match.group(0)))
+        text = _cut(text, match.span())
+
+    match = TIME_RE.search(text)
+    if match:
+        note['note_time'] = _valid_time(match.group(1), match.group(2))
+        if match.group(3):
+            note['end_time'] = _valid_time(match.group(3), match.group(4))
+        if note['note_time'] is None or (match.group(3) and note['end_time'] is None):
+            return None
+        text = _cut(text, match.span())
+
+    parsed_date, span = _parse_date(text, today)
+    if span:
+        if parsed_date is None:
+            return None
+        note['note_date'] = parsed_date
+        text = _cut(text, span)
+    elif note['recurrence'] and 'BYDAY' in note['recurrence']:
+        # "каждую пятницу" без даты начинается с ближайшей пятницы
+        weekday = RRULE_DAYS.index(note['recurrence'][-2:])
+        note['note_date'] = default_date + timedelta(days=(weekday - default_date.weekday()) % 7)
+
+    title = TRIM_RE.sub('', SPACES_RE.sub(' ', text))
+    if not title and note['note_time'] is None and span:
+        return 'date', parsed_date
+    if not title or note['note_time'] is None:
+        return None
+
+    note['title'] = title
+    note['note_date'] = note['note_date'].strftime('%Y-%m-%d')
+    return note
+
+
+def parse_message(text, today=None):
+    # Возвращает (заметки, строки, которые не удалось разобрать)
+    today = today or datetime.now().date()
+    current_date = today
+    notes = []
+    errors = []
+
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        result = parse_line(line, current_date, today)
+        if isinstance(result, tuple):
+            current_date = result[1]
+        elif result is None:
+            errors.append(line.strip())
+        else:
+            notes.append(result)
+
+    return notes, errors
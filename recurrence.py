@@ -0,0 +1,141 @@
+import calendar
+import threading
+from datetime import date, datetime, timedelta
+
+from cache import TTLCache
+
+# Повторяющиеся события хранятся одной строкой с правилом в духе RRULE:
+# FREQ=DAILY|WEEKLY|MONTHLY|YEARLY, INTERVAL, BYDAY, COUNT, UNTIL.
+# Экземпляры генерируются лениво и только для запрошенного окна дат.
+
+RRULE_DAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+
+
+def _to_date(value):
+    if isinstance(value, date):
+        return value
+    value = str(value).replace('-', '')[:8]
+    return datetime.strptime(value, '%Y%m%d').date()
+
+
+def parse_rule(rule):
+    parts = dict(part.split('=', 1) for part in rule.upper().split(';') if '=' in part)
+    return {
+        'freq': parts.get('FREQ', 'DAILY'),
+        'interval': max(int(parts.get('INTERVAL', 1)), 1),
+        'byday': sorted(RRULE_DAYS.index(day) for day in parts['BYDAY'].split(',')) if 'BYDAY' in parts else None,
+        'count': int(parts['COUNT']) if 'COUNT' in parts else None,
+        'until': _to_date(parts['UNTIL']) if 'UNTIL' in parts else None,
+    }
+
+
+def _add_months(start, months):
+    # None, если в месяце нет такого числа (31-е, 29 февраля)
+    month_index = start.month - 1 + months
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    if start.day > calendar.monthrange(year, month)[1]:
+        return None
+    return date(year, month, start.day)
+
+
+def _candidates(rule, start, from_date):
+    # Все даты серии начиная с периода, в который попадает from_date
+    freq, interval = rule['freq'], rule['interval']
+
+    if freq == 'DAILY':
+        step = max(-(-(from_date - start).days // interval), 0)
+        current = start + timedelta(days=step * interval)
+        while True:
+            yield current
+            current += timedelta(days=interval)
+
+    elif freq == 'WEEKLY':
+        byday = rule['byday'] or [start.weekday()]
+        first_monday = start - timedelta(days=start.weekday())
+        weeks = max((from_date - first_monday).days // 7, 0)
+        week = weeks - weeks % interval
+        while True:
+            monday = first_monday + timedelta(weeks=week)
+            for weekday in byday:
+                current = monday + timedelta(days=weekday)
+                if current >= start:
+                    yield current
+            week += interval
+
+    elif freq in ('MONTHLY', 'YEARLY'):
+        interval = interval * (12 if freq == 'YEARLY' else 1)
+        months = max((from_date.year - start.year) * 12 + from_date.month - start.month, 0)
+        step = months - months % interval
+        while True:
+            current = _add_months(start, step)
+            if current is not None:
+                yield current
+            step += interval
+
+
+def occurrences(rule, start, window_start, window_end):
+    # Даты экземпляров серии, попадающие в [window_start, window_end]
+    if isinstance(rule, str):
+        rule = parse_rule(rule)
+    start, window_start, window_end = _to_date(start), _to_date(window_start), _to_date(window_end)
+    if rule['until'] and rule['until'] < window_end:
+        window_end = rule['until']
+    if window_end < start or window_end < window_start:
+        return
+
+    # С COUNT приходится считать экземпляры с начала серии
+    from_date = start if rule['count'] else max(start, window_start)
+    emitted = 0
+    for current in _candidates(rule, start, from_date):
+        if current > window_end:
+            return
+        emitted += 1
+        if current >= window_start:
+            yield current
+        if rule['count'] and emitted >= rule['count']:
+            return
+
+
+def expand_note(note, window_start, window_end):
+    # Экземпляры заметки-серии (словаря) в окне; id экземпляра включает дату
+    if not note.get('recurrence'):
+        yield note
+        return
+    for day in occurrences(note['recurrence'], note['note_date'], window_start, window_end):
+        occurrence = dict(note)
+        occurrence['note_date'] = day.strftime('%Y-%m-%d')
+        occurrence['series_id'] = note['id']
+        occurrence['id'] = f"{note['id']}:{occurrence['note_date']}"
+        yield occurrence
+
+
+# Кэш развернутых окон по семьям. Запись любой заметки семьи повышает ее
+# версию, и старые окна перестают находиться.
+class OccurrenceCache:
+    def __init__(self, maxsize=1000, ttl=300):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._versions = {}
+        # Кэш разделяется потоками пула соединений Database
+        self._lock = threading.Lock()
+
+    def _key(self, family_id, window_start, window_end):
+        return family_id, self._versions.get(family_id, 0), str(window_start), str(window_end)
+
+    def get(self, family_id, window_start, window_end):
+        with self._lock:
+            return self._cache.get(self._key(family_id, window_start, window_end))
+
+    def set(self, family_id, window_start, window_end, value):
+        with self._lock:
+            self._cache.set(self._key(family_id, window_start, window_end), value)
+
+    def invalidate(self, family_id=None):
+        with self._lock:
+            if family_id is None:
+                self._cache.clear()
+            else:
+                self._versions[family_id] = self._versions.get(family_id, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return self._cache.stats()
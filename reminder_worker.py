@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+
+import bot as app
+from database import reminder_shard
+from scheduler import ReminderScheduler
+from sender import GLOBAL_RATE, MessageSender
+
+# Отдельная рассылка напоминаний: python reminder_worker.py (бот при этом
+# запускается с RUN_SCHEDULER=0). Семьи делятся на REMINDER_SHARDS шардов по
+# хэшу family_id, процесс N из REMINDER_PROCESSES претендует на шарды с
+# номером shard % REMINDER_PROCESSES == N. Шард обслуживает держатель аренды
+# в reminder_leases: процесс реплики забирает шард, только когда прежний
+# владелец перестал продлевать аренду. Условие на шард входит в запросы, так
+# что каждый процесс читает только заметки своих семей; новые заметки (в том
+# числе добавленные ботом в другом процессе) подхватываются опросом раз в
+# минуту. Захват в reminder_claims не дает отправить напоминание дважды и во
+# время смены владельца.
+
+REMINDER_PROCESSES = int(os.getenv('REMINDER_PROCESSES', str(os.cpu_count() or 1)))
+REMINDER_SHARDS = int(os.getenv('REMINDER_SHARDS', str(REMINDER_PROCESSES)))
+REMINDER_LEASE_TTL = int(os.getenv('REMINDER_LEASE_TTL', '60'))
+# Метрики процесса N - на порту REMINDER_METRICS_PORT + N, 0 отключает
+REMINDER_METRICS_PORT = int(os.getenv('REMINDER_METRICS_PORT', '9200'))
+
+
+def shard_of(family_id):
+    return reminder_shard(family_id, REMINDER_SHARDS)
+
+
+async def run_worker(index):
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    candidates = [shard for shard in range(REMINDER_SHARDS) if shard % REMINDER_PROCESSES == index]
+    owned = set()
+
+    # Лимит Telegram общий для токена, поэтому делится между процессами
+    app.sender = MessageSender(app.bot, workers=app.SEND_WORKERS, global_rate=GLOBAL_RATE / REMINDER_PROCESSES)
+    app.REMINDER_OWNER = owner
+
+    async def load_window(start, end):
+        return await app.storage.get_window_notes(start, end, (sorted(owned), REMINDER_SHARDS))
+
+    async def load_new(after_id, start, end):
+        return await app.storage.get_new_notes(after_id, start, end, (sorted(owned), REMINDER_SHARDS))
+
+    async def fire(notes):
+        # Шард мог уйти к другому процессу после загрузки дня
+        await app.send_reminders([note for note in notes if shard_of(note['family_id']) in owned])
+
+    scheduler = ReminderScheduler(load_window, fire, profiler=app.scheduler.profiler, load_new=load_new)
+
+    async def renew_leases():
+        nonlocal owned
+        acquired = set(await app.storage.acquire_reminder_leases(owner, candidates, REMINDER_LEASE_TTL))
+        if acquired != owned:
+            logging.info(f"Процесс {index}: шарды {sorted(acquired)}")
+            owned = acquired
+            scheduler.resync()
+
+    async def keep_leases():
+        while True:
+            await asyncio.sleep(REMINDER_LEASE_TTL / 3)
+            try:
+                await renew_leases()
+            except Exception:
+                logging.exception("Не удалось продлить аренду шардов")
+
+    await renew_leases()
+    app.sender.start()
+    if REMINDER_METRICS_PORT:
+        await app.start_metrics_server(REMINDER_METRICS_PORT + index)
+    try:
+        await asyncio.gather(keep_leases(), scheduler.run())
+    finally:
+        await app.storage.release_reminder_leases(owner)
+
+
+def run_process(index):
+    asyncio.run(run_worker(index))
+
+
+if __name__ == '__main__':
+    print(f"🔔 Рассылка напоминаний: процессов {REMINDER_PROCESSES}, шардов {REMINDER_SHARDS}")
+    # spawn: дочерние процессы открывают собственные соединения с БД
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=run_process, args=(i,)) for i in range(1, REMINDER_PROCESSES)]
+    for worker in workers:
+        worker.start()
+    run_process(0)
+    for worker in workers:
+        worker.join()
@@ -0,0 +1,200 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timedelta
+
+from metrics import (SCHEDULER_ERRORS, SCHEDULER_FIRE_SECONDS, SCHEDULER_FIRED, SCHEDULER_HEAP,
+                     SCHEDULER_LAG_SECONDS, SCHEDULER_PENDING, SCHEDULER_TICK_SECONDS, SlowTickProfiler)
+
+# Значение по умолчанию совпадает со схемой notes в database.py
+DEFAULT_REMINDER_MINUTES = 30
+# Напоминание не раньше чем за неделю до события; разбор заметок и импорт
+# отклоняют большие сроки, а здесь они ограничиваются на случай старых строк
+MAX_REMINDER_MINUTES = 7 * 24 * 60
+
+
+def note_event_at(note):
+    note_time = note['note_time'][:5] if isinstance(note['note_time'], str) else str(note['note_time'])[:5]
+    return datetime.strptime(f"{note['note_date']} {note_time}", '%Y-%m-%d %H:%M')
+
+
+def note_fire_at(note):
+    minutes = note.get('reminder_minutes')
+    if minutes is None:
+        minutes = DEFAULT_REMINDER_MINUTES
+    return note_event_at(note) - timedelta(minutes=min(max(minutes, 0), MAX_REMINDER_MINUTES))
+
+
+def reminder_window(now):
+    # (первая дата событий, последняя дата событий, граница срабатывания):
+    # в очереди напоминания, срабатывающие сегодня и завтра, а события для
+    # них берутся на MAX_REMINDER_MINUTES вперед - напоминание за несколько
+    # дней до события встает в очередь вовремя
+    start = now.date()
+    end = start + timedelta(days=1, minutes=MAX_REMINDER_MINUTES)
+    fire_before = datetime.combine(start + timedelta(days=2), datetime.min.time())
+    return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'), fire_before
+
+
+# Очередь напоминаний в памяти, упорядоченная по времени срабатывания.
+# load_window(start, end) возвращает заметки с датами событий с start по end
+# включительно, fire(notes) отправляет пачку сработавших напоминаний. В
+# памяти держатся только напоминания на сегодня и завтра (reminder_window).
+# Повторную отправку после перезагрузки дня или перезапуска отсекает fire:
+# бот захватывает каждое напоминание в reminder_claims.
+# load_new(after_id, start, end) возвращает (напоминания окна по заметкам с id
+# больше after_id, наибольший id заметок); с ним раз в poll_interval
+# подхватываются заметки, созданные в обход бота (веб-приложение, другие
+# процессы), а полная перезагрузка дней раз в resync_interval остается страховкой.
+class ReminderScheduler:
+
+    def __init__(self, load_window, fire, resync_interval=600, profiler=None, load_new=None, poll_interval=60):
+        self.load_window = load_window
+        self.fire = fire
+        self.resync_interval = resync_interval
+        self.load_new = load_new
+        self.poll_interval = poll_interval
+        self.profiler = profiler or SlowTickProfiler()
+        self._last_id = None  # наибольший id заметок на момент последней загрузки
+        # (fire_at, порядковый номер, note_id): номер разрешает равные сроки,
+        # не сравнивая id - у экземпляров серий они строковые
+        self._heap = []
+        self._sequence = itertools.count()
+        self._notes = {}     # note_id -> (fire_at, note)
+        self._window = None  # (start, end) загруженных дат событий
+        self._fire_before = None  # напоминания с этого момента не хранятся
+        self._wakeup = asyncio.Event()
+        self._resync_requested = False
+        SCHEDULER_PENDING.set_function(self.__len__)
+        SCHEDULER_HEAP.set_function(lambda: len(self._heap))
+
+    def add(self, note, now=None):
+        note_id = note['id']
+        now = now or datetime.now()
+        # Событие уже прошло - напоминать поздно
+        if note_event_at(note) < now:
+            self._notes.pop(note_id, None)
+            return
+        fire_at = note_fire_at(note)
+        # Сработает после завтра - встанет в очередь при одной из следующих загрузок
+        if self._fire_before is not None and fire_at >= self._fire_before:
+            self._notes.pop(note_id, None)
+            return
+        current = self._notes.get(note_id)
+        self._notes[note_id] = (fire_at, note)
+        if current is None or current[0] != fire_at:
+            heapq.heappush(self._heap, (fire_at, next(self._sequence), note_id))
+            self._wakeup.set()
+
+    def remove(self, note_id):
+        # Запись в куче удаляется лениво при извлечении
+        self._notes.pop(note_id, None)
+
+    def __len__(self):
+        return len(self._notes)
+
+    def pop_due(self, now=None):
+        now = now or datetime.now()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, _, note_id = heapq.heappop(self._heap)
+            entry = self._notes.get(note_id)
+            if entry is None or entry[0] != fire_at:
+                continue
+            del self._notes[note_id]
+            SCHEDULER_LAG_SECONDS.observe(max((now - fire_at).total_seconds(), 0))
+            due.append(entry[1])
+        return due
+
+    def next_fire_at(self):
+        while self._heap:
+            fire_at, _, note_id = self._heap[0]
+            entry = self._notes.get(note_id)
+            if entry is not None and entry[0] == fire_at:
+                return fire_at
+            heapq.heappop(self._heap)
+        return None
+
+    async def sync_window(self, start, end, fire_before, now=None):
+        self._fire_before = fire_before
+        notes = await self.load_window(start, end)
+        seen = set()
+        for note in notes:
+            seen.add(note['id'])
+            self._add_loaded(note, now)
+        # Заметки, удаленные с момента прошлой загрузки или оставшиеся в
+        # прошедших днях; созданные во время загрузки вернет опрос
+        for note_id in list(self._notes):
+            if note_id not in seen:
+                self.remove(note_id)
+        self._window = (start, end)
+
+    async def poll(self, start, end, now=None):
+        # Только заметки, созданные после прошлой загрузки или опроса
+        if self._last_id is None:
+            return
+        notes, self._last_id = await self.load_new(self._last_id, start, end)
+        for note in notes:
+            self._add_loaded(note, now)
+
+    def _add_loaded(self, note, now):
+        # Испорченная строка (дата, время, срок напоминания) пропускается,
+        # а не прерывает загрузку остальных заметок дня
+        try:
+            self.add(note, now)
+        except Exception:
+            SCHEDULER_ERRORS.inc()
+            logging.exception(f"Заметка {note.get('id')} пропущена планировщиком")
+
+    def resync(self):
+        # Перезагрузить дни при ближайшем такте, например после смены шардов
+        self._resync_requested = True
+        self._wakeup.set()
+
+    async def run(self):
+        last_sync = last_poll = None
+        while True:
+            now = datetime.now()
+            start, end, fire_before = reminder_window(now)
+
+            started = time.perf_counter()
+            try:
+                with self.profiler.profile('scheduler_tick'):
+                    # С наступлением нового дня окно сдвигается целиком
+                    resync = (self._resync_requested or self._window != (start, end)
+                              or (now - last_sync).total_seconds() >= self.resync_interval)
+                    self._resync_requested = False
+                    if resync:
+                        if self.load_new:
+                            # id запоминается до загрузки, чтобы опрос не пропустил
+                            # заметки, созданные во время нее
+                            _, last_id = await self.load_new(None, start, end)
+                        await self.sync_window(start, end, fire_before, now)
+                        last_sync = last_poll = now
+                        if self.load_new:
+                            self._last_id = last_id
+                    elif self.load_new and (now - last_poll).total_seconds() >= self.poll_interval:
+                        await self.poll(start, end, now)
+                        last_poll = now
+
+                    due = self.pop_due(now)
+                    if due:
+                        SCHEDULER_FIRED.inc(len(due))
+                        with SCHEDULER_FIRE_SECONDS.time():
+                            await self.fire(due)
+            except Exception:
+                SCHEDULER_ERRORS.inc()
+                logging.exception("Ошибка планировщика напоминаний")
+            SCHEDULER_TICK_SECONDS.observe(time.perf_counter() - started)
+
+            timeout = self.poll_interval if self.load_new else self.resync_interval
+            next_fire = self.next_fire_at()
+            if next_fire is not None:
+                timeout = min(timeout, max((next_fire - datetime.now()).total_seconds(), 0))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
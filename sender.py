@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramAPIError
+
+from metrics import SEND_LATENCY_SECONDS, SEND_QUEUE, SEND_RETRIES, SEND_TOTAL
+
+# Лимиты Telegram: около 30 сообщений в секунду всего и 1 в секунду на чат
+GLOBAL_RATE = 30
+CHAT_RATE = 1
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Очередь исходящих сообщений: пул воркеров отправляет сообщения с учетом
+# общего и поканального лимита и повторяет отправку после TelegramRetryAfter.
+# Сообщение, которому еще рано в свой чат, откладывается и возвращается в
+# очередь к своему времени, а воркер берет следующее: пачка сообщений одному
+# чату не задерживает остальные чаты.
+class MessageSender:
+    def __init__(self, bot, workers=8, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE, max_retries=3):
+        self.bot = bot
+        self.workers = workers
+        self.max_retries = max_retries
+        self.chat_interval = 1 / chat_rate
+        self.bucket = TokenBucket(global_rate)
+        self.queue = asyncio.Queue()  # (chat_id, text, kwargs, queued_at, attempt, slot)
+        self._chat_next = {}  # chat_id -> время, раньше которого писать в чат нельзя
+        self._tasks = []
+        self.deferred = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        SEND_QUEUE.set_function(self.depth)
+
+    def send(self, chat_id, text, **kwargs):
+        self.queue.put_nowait((chat_id, text, kwargs, time.monotonic(), 0, None))
+
+    def depth(self):
+        return self.queue.qsize() + self.deferred
+
+    def start(self):
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        # join ждет и отложенные сообщения: task_done для них вызывается
+        # только после возврата в очередь
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def stats(self):
+        return {
+            'queue_depth': self.depth(),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'latency_avg': self.latency_total / self.sent if self.sent else 0.0,
+            'latency_max': self.latency_max,
+        }
+
+    def _reserve_chat(self, chat_id):
+        # Слот в чате занимается при первом взятии сообщения из очереди,
+        # поэтому сообщения одному чату уходят в порядке отправки
+        now = time.monotonic()
+        slot = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = slot + self.chat_interval
+        if len(self._chat_next) > 10000:
+            self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+        return slot
+
+    def _defer(self, ready_at, item):
+        self.deferred += 1
+        asyncio.get_running_loop().call_later(max(ready_at - time.monotonic(), 0.0), self._requeue, item)
+
+    def _requeue(self, item):
+        self.deferred -= 1
+        self.queue.put_nowait(item)
+        self.queue.task_done()
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            chat_id, text, kwargs, queued_at, attempt, slot = item
+            deferral = None
+            try:
+                if slot is None:
+                    slot = self._reserve_chat(chat_id)
+                if slot > time.monotonic():
+                    deferral = (slot, (chat_id, text, kwargs, queued_at, attempt, slot))
+                else:
+                    retry_at = await self._deliver(chat_id, text, kwargs, queued_at, attempt)
+                    if retry_at is not None:
+                        deferral = (retry_at, (chat_id, text, kwargs, queued_at, attempt + 1, None))
+            except Exception:
+                # Неожиданная ошибка теряет одно сообщение, а не воркер:
+                # иначе очередь молча перестает разбираться
+                self.failed += 1
+                SEND_TOTAL.inc(result='failed')
+                logging.exception(f"Ошибка отправки сообщения в чат {chat_id}")
+            finally:
+                if deferral:
+                    self._defer(*deferral)
+                else:
+                    self.queue.task_done()
+
+    async def _deliver(self, chat_id, text, kwargs, queued_at, attempt):
+        # Одна попытка отправки; возвращает время повтора или None
+        await self.bucket.acquire()
+        try:
+            await self.bot.send_message(chat_id, text, **kwargs)
+        except TelegramRetryAfter as e:
+            self.bucket.pause(e.retry_after)
+            self._chat_next[chat_id] = time.monotonic() + e.retry_after
+            return self._retry(chat_id, attempt, 'retry_after', time.monotonic() + e.retry_after)
+        except TelegramNetworkError:
+            return self._retry(chat_id, attempt, 'network', time.monotonic() + 2 ** attempt)
+        except TelegramAPIError as e:
+            self.failed += 1
+            SEND_TOTAL.inc(result='failed')
+            logging.warning(f"Не удалось отправить сообщение в чат {chat_id}: {e}")
+            return None
+        latency = time.monotonic() - queued_at
+        self.sent += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        SEND_TOTAL.inc(result='sent')
+        SEND_LATENCY_SECONDS.observe(latency)
+        return None
+
+    def _retry(self, chat_id, attempt, reason, retry_at):
+        if attempt >= self.max_retries:
+            self.failed += 1
+            SEND_TOTAL.inc(result='failed')
+            logging.warning(f"Сообщение в чат {chat_id} не отправлено после {self.max_retries} повторов")
+            return None
+        self.retried += 1
+        SEND_RETRIES.inc(reason=reason)
+        return retry_at
@@ -0,0 +1,396 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import register_cache, track_query
+from recurrence import OccurrenceCache, expand_note
+
+
+# Хранилище бота: общий интерфейс для Supabase и SQLite. Записи возвращаются
+# в формате схемы Supabase (families.code/name, users.telegram_id,
+# notes.description, автор заметки вложен в поле users). Бэкенды реализуют
+# выборки, а сборка дня для планировщика из разовых заметок и экземпляров
+# серий общая.
+# Синхронные вызовы выполняются в ограниченном пуле потоков, поэтому запросы
+# не блокируют цикл событий aiogram.
+class Storage:
+    backend = None
+
+    def __init__(self, max_workers=8):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=self.backend)
+        self.queries = 0
+
+    async def _run(self, name, function, *args):
+        # name - метка запроса в метриках db_query_seconds
+        loop = asyncio.get_running_loop()
+        self.queries += 1
+        with track_query(self.backend, name):
+            return await loop.run_in_executor(self.executor, function, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    # Пользователи и семьи
+    async def get_user_family(self, telegram_id):
+        # (family_id, {'name', 'code'}) или (None, None)
+        raise NotImplementedError
+
+    async def create_family(self, family):
+        # Возвращает созданную семью; бэкенд может назначить свой id
+        raise NotImplementedError
+
+    async def get_family_by_code(self, family_code):
+        # {'id', 'name'} или None
+        raise NotImplementedError
+
+    async def add_user(self, user):
+        raise NotImplementedError
+
+    async def get_family_members(self, family_id):
+        # [{'full_name', 'role'}]
+        raise NotImplementedError
+
+    async def _members(self, family_ids):
+        # [{'telegram_id', 'family_id'}] участников перечисленных семей
+        raise NotImplementedError
+
+    async def get_members_map(self, family_ids):
+        # Одна выборка участников сразу для всех семей вместо запроса на каждую
+        members_map = {family_id: [] for family_id in family_ids}
+        if not members_map:
+            return members_map
+        for member in await self._members(list(members_map)):
+            members_map.setdefault(member['family_id'], []).append(member['telegram_id'])
+        return members_map
+
+    # Заметки
+    async def add_notes(self, notes):
+        # Вставка одним запросом, возвращает вставленные заметки с id
+        raise NotImplementedError
+
+    async def get_family_day_notes(self, family_id, day):
+        # Заметки семьи на день вместе с экземплярами серий, по времени
+        raise NotImplementedError
+
+    async def _day_notes(self, day, end_date=None, after_id=None, shards=None):
+        # Разовые заметки всех семей на день или по end_date включительно;
+        # after_id оставляет только созданные после заметки after_id, shards -
+        # (номера шардов, число шардов) - только семьи этих шардов
+        raise NotImplementedError
+
+    async def _series(self, end_date, after_id=None, shards=None):
+        # Серии всех семей, начавшиеся не позже end_date
+        raise NotImplementedError
+
+    async def _last_note_id(self):
+        raise NotImplementedError
+
+    async def get_window_notes(self, start_date, end_date, shards=None):
+        # Заметки и экземпляры серий всех семей с датами с start_date по
+        # end_date для планировщика напоминаний
+        notes, series = await asyncio.gather(
+            self._day_notes(start_date, end_date, shards=shards),
+            self._series(end_date, shards=shards)
+        )
+        return notes + [occurrence for note in series for occurrence in expand_note(note, start_date, end_date)]
+
+    async def get_new_notes(self, after_id, start_date, end_date, shards=None):
+        # (напоминания окна по заметкам, созданным после after_id, наибольший
+        # id заметок) для опроса планировщика; без after_id - только id
+        last_id = await self._last_note_id()
+        if after_id is None:
+            return [], last_id
+        notes, series = await asyncio.gather(
+            self._day_notes(start_date, end_date, after_id, shards),
+            self._series(end_date, after_id, shards)
+        )
+        occurrences = [occurrence for note in series for occurrence in expand_note(note, start_date, end_date)]
+        return notes + occurrences, max(last_id, after_id)
+
+    async def _family_notes_page(self, family_id, after_id, limit):
+        # Заметки семьи с id больше after_id (None - с начала) по возрастанию id
+        raise NotImplementedError
+
+    async def iter_family_notes(self, family_id, page_size=500):
+        # Все заметки семьи страницами; в памяти не больше одной страницы
+        after_id = None
+        while True:
+            page = await self._family_notes_page(family_id, after_id, page_size)
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            after_id = page[-1]['id']
+
+    # Рассылка напоминаний несколькими процессами
+    async def acquire_reminder_leases(self, owner, shards, ttl):
+        # Продлевает аренду своих шардов и забирает свободные или просроченные;
+        # возвращает шарды, которыми owner владеет после вызова
+        raise NotImplementedError
+
+    async def release_reminder_leases(self, owner):
+        raise NotImplementedError
+
+    async def claim_reminders(self, notes, owner):
+        # Возвращает заметки, напоминания которых захвачены этим вызовом:
+        # каждое напоминание захватывается один раз на все процессы и реплики,
+        # напоминания удаленных с момента загрузки заметок не захватываются
+        raise NotImplementedError
+
+
+# Supabase: синхронный клиент, HTTP-соединения переиспользуются между вызовами
+class SupabaseStorage(Storage):
+    backend = 'supabase'
+    # Строк на страницу выборок для планировщика, меньше max-rows PostgREST
+    page_size = 500
+
+    def __init__(self, client, max_workers=8):
+        super().__init__(max_workers)
+        self.client = client
+        # Экземпляры серий по семьям; запись заметок семьи сбрасывает ее окна
+        self.occurrences = OccurrenceCache()
+        register_cache('occurrences', self.occurrences)
+
+    async def _execute(self, name, query):
+        result = await self._run(name, query.execute)
+        return result.data
+
+    async def get_user_family(self, telegram_id):
+        data = await self._execute(
+            'get_user_family',
+            self.client.table('users').select('family_id, families(name, code)').eq('telegram_id', telegram_id)
+        )
+        if data:
+            return data[0]['family_id'], data[0]['families']
+        return None, None
+
+    async def create_family(self, family):
+        data = await self._execute('create_family', self.client.table('families').insert(family))
+        return data[0]
+
+    async def get_family_by_code(self, family_code):
+        data = await self._execute('get_family_by_code', self.client.table('families').select('id, name').eq('code', family_code))
+        return data[0] if data else None
+
+    async def add_user(self, user):
+        return await self._execute('add_user', self.client.table('users').insert(user))
+
+    async def get_family_members(self, family_id):
+        return await self._execute('get_family_members', self.client.table('users').select('full_name, role').eq('family_id', family_id))
+
+    async def _members(self, family_ids):
+        return await self._execute(
+            'get_members_map',
+            self.client.table('users').select('telegram_id, family_id').in_('family_id', family_ids)
+        )
+
+    async def add_notes(self, notes):
+        inserted = await self._execute('add_notes', self.client.table('notes').insert(notes))
+        for family_id in {note['family_id'] for note in notes if note.get('recurrence')}:
+            self.occurrences.invalidate(family_id)
+        return inserted
+
+    async def _family_day_notes(self, family_id, day):
+        return await self._execute(
+            'get_family_day_notes',
+            self.client.table('notes').select('*, users(full_name, avatar_color)')
+            .eq('family_id', family_id).eq('note_date', day).is_('recurrence', 'null').order('note_time')
+        )
+
+    async def _family_series(self, family_id, end_date):
+        return await self._execute(
+            'get_family_series',
+            self.client.table('notes').select('*, users(full_name, avatar_color)')
+            .eq('family_id', family_id).not_.is_('recurrence', 'null').lte('note_date', end_date)
+        )
+
+    async def get_family_series_occurrences(self, family_id, start_date, end_date):
+        # Серии хранятся одной строкой, экземпляры окна кэшируются по семье
+        cached = self.occurrences.get(family_id, start_date, end_date)
+        if cached is not None:
+            return cached
+        series = await self._family_series(family_id, end_date)
+        result = [occurrence for note in series for occurrence in expand_note(note, start_date, end_date)]
+        self.occurrences.set(family_id, start_date, end_date, result)
+        return result
+
+    async def get_family_day_notes(self, family_id, day):
+        notes, series = await asyncio.gather(
+            self._family_day_notes(family_id, day),
+            self.get_family_series_occurrences(family_id, day, day)
+        )
+        if not series:
+            return notes
+        return sorted(notes + series, key=lambda note: note['note_time'])
+
+    async def _pages(self, name, page, after_id):
+        # Заметки всех семей для планировщика идут страницами по id: PostgREST
+        # молча обрезает ответ до max-rows (в Supabase по умолчанию 1000).
+        # page(after_id) - запрос страницы с id больше after_id по возрастанию id
+        rows = []
+        while True:
+            data = await self._execute(name, page(after_id))
+            rows.extend(data)
+            if len(data) < self.page_size:
+                return rows
+            after_id = data[-1]['id']
+
+    async def _reminder_notes(self, name, start_date, end_date, series, after_id, shards):
+        # Выборка с условием на шард выполняется функцией reminder_notes из
+        # supabase/reminder_delivery.sql: PostgREST не фильтрует по выражениям
+        owned, count = shards
+        if not owned:
+            return []
+        return await self._pages(name, lambda after: self.client.rpc('reminder_notes', {
+            'p_start': start_date, 'p_end': end_date, 'p_series': series, 'p_after_id': after,
+            'p_shards': list(owned), 'p_shard_count': count, 'p_limit': self.page_size,
+        }), after_id)
+
+    async def _day_notes(self, day, end_date=None, after_id=None, shards=None):
+        name = 'get_day_notes' if after_id is None else 'get_new_notes'
+        if shards is not None:
+            return await self._reminder_notes(name, day, end_date or day, False, after_id, shards)
+
+        def page(after):
+            query = self.client.table('notes').select('*, users(full_name)').is_('recurrence', 'null')
+            query = query.gte('note_date', day).lte('note_date', end_date or day)
+            if after is not None:
+                query = query.gt('id', after)
+            return query.order('id').limit(self.page_size)
+        return await self._pages(name, page, after_id)
+
+    async def _series(self, end_date, after_id=None, shards=None):
+        name = 'get_day_series' if after_id is None else 'get_new_series'
+        if shards is not None:
+            return await self._reminder_notes(name, None, end_date, True, after_id, shards)
+
+        def page(after):
+            query = self.client.table('notes').select('*, users(full_name)').not_.is_('recurrence', 'null').lte('note_date', end_date)
+            if after is not None:
+                query = query.gt('id', after)
+            return query.order('id').limit(self.page_size)
+        return await self._pages(name, page, after_id)
+
+    async def _last_note_id(self):
+        data = await self._execute('get_last_note_id', self.client.table('notes').select('id').order('id', desc=True).limit(1))
+        return data[0]['id'] if data else 0
+
+    async def _family_notes_page(self, family_id, after_id, limit):
+        query = self.client.table('notes').select('*').eq('family_id', family_id)
+        if after_id is not None:
+            query = query.gt('id', after_id)
+        return await self._execute('get_family_notes_page', query.order('id').limit(limit))
+
+    # Функции из supabase/reminder_delivery.sql
+    async def acquire_reminder_leases(self, owner, shards, ttl):
+        data = await self._execute('acquire_reminder_leases', self.client.rpc(
+            'acquire_reminder_leases', {'p_owner': owner, 'p_shards': list(shards), 'p_ttl_seconds': ttl}
+        ))
+        return [row['shard'] for row in data]
+
+    async def release_reminder_leases(self, owner):
+        await self._execute('release_reminder_leases', self.client.rpc('release_reminder_leases', {'p_owner': owner}))
+
+    async def claim_reminders(self, notes, owner):
+        if not notes:
+            return []
+        data = await self._execute('claim_reminders', self.client.rpc('claim_reminders', {
+            'p_owner': owner,
+            'p_ids': [str(note['id']) for note in notes],
+            'p_note_ids': [note.get('series_id', note['id']) for note in notes],
+            'p_dates': [note['note_date'] for note in notes],
+        }))
+        claimed = {row['reminder_id'] for row in data}
+        return [note for note in notes if str(note['id']) in claimed]
+
+
+# SQLite: адаптер к database.Database. Запросы, схема, пул соединений и кэш
+# экземпляров серий общие с ней, здесь строки переводятся в формат Supabase.
+# id семьи назначает SQLite, поэтому бот берет его из результата create_family.
+class SqliteStorage(Storage):
+    backend = 'sqlite'
+
+    def __init__(self, db, max_workers=None):
+        super().__init__(max_workers or db.pool.readers + 1)
+        self.db = db
+        # Строки заметок Database: n.*, author_name, avatar_color
+        self._author_column = len(db.note_columns)
+
+    def close(self):
+        super().close()
+        self.db.close()
+
+    def _note(self, row):
+        note = dict(zip(self.db.note_columns, row))
+        note['description'] = note.pop('content')
+        note['is_important'] = bool(note['is_important'])
+        full_name, avatar_color = row[self._author_column:self._author_column + 2]
+        note['users'] = {'full_name': full_name, 'avatar_color': avatar_color} if full_name is not None else None
+        return note
+
+    async def _notes(self, name, function, *args):
+        return [self._note(row) for row in await self._run(name, function, *args)]
+
+    async def get_user_family(self, telegram_id):
+        row = await self._run('get_user_family', self.db.get_user_family, telegram_id)
+        if row:
+            return row[0], {'name': row[1], 'code': row[5]}
+        return None, None
+
+    async def create_family(self, family):
+        family_id = await self._run('create_family', self.db.create_family,
+                                    family['code'], family['name'], family.get('theme_color'))
+        return dict(family, id=family_id)
+
+    async def get_family_by_code(self, family_code):
+        row = await self._run('get_family_by_code', self.db.get_family_by_code, family_code)
+        return {'id': row[0], 'name': row[1]} if row else None
+
+    async def add_user(self, user):
+        await self._run('add_user', self.db.add_user, user['telegram_id'], user.get('username'), user.get('full_name'),
+                        user['family_id'], user.get('role', 'member'), user.get('avatar_color'))
+
+    async def get_family_members(self, family_id):
+        rows = await self._run('get_family_members', self.db.get_family_members, family_id)
+        return [{'full_name': full_name, 'role': role} for _, full_name, role, _ in rows]
+
+    async def _members(self, family_ids):
+        rows = await self._run('get_members_map', self.db.get_members, family_ids)
+        return [{'telegram_id': telegram_id, 'family_id': family_id} for telegram_id, family_id in rows]
+
+    async def add_notes(self, notes):
+        notes = [dict(note, description=note.get('description'), reminder_minutes=note.get('reminder_minutes', 30),
+                      recurrence=note.get('recurrence')) for note in notes]
+        ids = await self._run('add_notes', self.db.add_notes,
+                              [dict(note, content=note['description']) for note in notes])
+        return [dict(note, id=note_id) for note, note_id in zip(notes, ids)]
+
+    async def get_family_day_notes(self, family_id, day):
+        notes = await self._notes('get_family_day_notes', self.db.get_family_notes, family_id, day)
+        return sorted(notes, key=lambda note: note['note_time'])
+
+    async def _day_notes(self, day, end_date=None, after_id=None, shards=None):
+        return await self._notes('get_day_notes' if after_id is None else 'get_new_notes',
+                                 self.db.get_day_notes, day, end_date, after_id, shards)
+
+    async def _series(self, end_date, after_id=None, shards=None):
+        return await self._notes('get_day_series' if after_id is None else 'get_new_series',
+                                 self.db.get_series, end_date, None, after_id, shards)
+
+    async def _last_note_id(self):
+        return await self._run('get_last_note_id', self.db.get_last_note_id)
+
+    async def _family_notes_page(self, family_id, after_id, limit):
+        return await self._notes('get_family_notes_page', self.db.get_family_notes_page, family_id, after_id, limit)
+
+    async def acquire_reminder_leases(self, owner, shards, ttl):
+        return await self._run('acquire_reminder_leases', self.db.acquire_reminder_leases, owner, shards, ttl)
+
+    async def release_reminder_leases(self, owner):
+        await self._run('release_reminder_leases', self.db.release_reminder_leases, owner)
+
+    async def claim_reminders(self, notes, owner):
+        if not notes:
+            return []
+        reminders = [(str(note['id']), note.get('series_id', note['id']), note['note_date']) for note in notes]
+        claimed = set(await self._run('claim_reminders', self.db.claim_reminders, reminders, owner))
+        return [note for note in notes if str(note['id']) in claimed]
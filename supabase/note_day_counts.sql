@@ -0,0 +1,15 @@
+-- Количество заметок семьи по дням для точек в веб-календаре.
+-- Календарь запрашивает только окно текущего месяца ±1, поэтому объем ответа
+-- не зависит от длины истории семьи.
+-- Серии (recurrence, см. recurrence.sql) здесь не считаются: календарь
+-- разворачивает их экземпляры сам и добавляет к счетчикам.
+-- security_invoker: view подчиняется политикам RLS таблицы notes.
+
+create index if not exists idx_notes_family_date on notes (family_id, note_date, note_time);
+
+create or replace view note_day_counts
+with (security_invoker = true) as
+select family_id, note_date, count(*)::int as notes_count
+from notes
+where recurrence is null
+group by family_id, note_date;
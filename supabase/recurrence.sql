@@ -0,0 +1,9 @@
+-- Повторяющиеся заметки: правило RRULE (подмножество из recurrence.py) в
+-- колонке recurrence, note_date - дата первого экземпляра. Экземпляры не
+-- хранятся, бот и веб-календарь разворачивают серию на нужное окно сами.
+-- Выполнить до reminder_delivery.sql и note_day_counts.sql.
+
+alter table notes add column if not exists recurrence text;
+
+create index if not exists idx_notes_family_series on notes (family_id, note_date)
+where recurrence is not null;
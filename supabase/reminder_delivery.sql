@@ -0,0 +1,110 @@
+-- Координация рассылки напоминаний между процессами и репликами
+-- reminder_worker.py. Шард (хэш family_id) обслуживает держатель аренды,
+-- каждое напоминание отправляет тот, кто первым его захватил.
+-- Таблицы закрыты RLS без политик, работа с ними идет только через функции.
+-- Функции работают в обход RLS (security definer), поэтому вызывать их может
+-- только service_role: bot.py и reminder_worker.py с Supabase запускаются с
+-- ключом service_role в SUPABASE_KEY, публичный ключ index.html их не видит.
+
+create table if not exists reminder_leases (
+    shard int primary key,
+    owner text not null,
+    expires_at timestamptz not null
+);
+
+create table if not exists reminder_claims (
+    reminder_id text primary key,
+    note_date date not null,
+    owner text not null,
+    claimed_at timestamptz not null default now()
+);
+
+create index if not exists idx_reminder_claims_date on reminder_claims (note_date);
+
+alter table reminder_leases enable row level security;
+alter table reminder_claims enable row level security;
+
+-- Шард семьи, как database.reminder_shard: первые 32 бита md5 по модулю
+create or replace function reminder_shard(p_family_id text, p_shard_count int)
+returns int
+language sql immutable as $$
+    select (('x' || substr(md5(p_family_id), 1, 8))::bit(32)::bigint % p_shard_count)::int;
+$$;
+
+-- Заметки для планировщика процесса рассылки: только семьи его шардов.
+-- p_series = false - разовые заметки с p_start по p_end, true - серии,
+-- начавшиеся не позже p_end; p_after_id - только созданные после этой заметки.
+-- Ответ PostgREST обрезается до max-rows, поэтому выборка идет страницами:
+-- p_limit строк по возрастанию id, следующая страница - с p_after_id = id
+-- последней строки. Автор вкладывается в поле users, как во вложенной
+-- выборке PostgREST
+drop function if exists reminder_notes(date, date, boolean, bigint, int[], int);
+
+create or replace function reminder_notes(p_start date, p_end date, p_series boolean, p_after_id bigint,
+                                          p_shards int[], p_shard_count int, p_limit int)
+returns setof jsonb
+language sql stable security definer set search_path = public as $$
+    select to_jsonb(n) || jsonb_build_object(
+        'users', case when u.telegram_id is null then null else jsonb_build_object('full_name', u.full_name) end
+    )
+    from notes n
+    left join users u on u.telegram_id = n.user_id
+    where (case when p_series
+               then n.recurrence is not null and n.note_date <= p_end
+               else n.recurrence is null and n.note_date between p_start and p_end end)
+    and (p_after_id is null or n.id > p_after_id)
+    and reminder_shard(n.family_id::text, p_shard_count) = any (p_shards)
+    order by n.id
+    limit p_limit;
+$$;
+
+-- Продлевает свои аренды и забирает свободные или просроченные;
+-- возвращает шарды, которыми p_owner владеет после вызова
+create or replace function acquire_reminder_leases(p_owner text, p_shards int[], p_ttl_seconds int)
+returns table (shard int)
+language sql security definer set search_path = public as $$
+    insert into reminder_leases as l (shard, owner, expires_at)
+    select s.shard_id, p_owner, now() + make_interval(secs => p_ttl_seconds)
+    from unnest(p_shards) as s(shard_id)
+    on conflict (shard) do update set owner = excluded.owner, expires_at = excluded.expires_at
+    where l.owner = excluded.owner or l.expires_at < now()
+    returning l.shard;
+$$;
+
+create or replace function release_reminder_leases(p_owner text)
+returns void
+language sql security definer set search_path = public as $$
+    delete from reminder_leases where owner = p_owner;
+$$;
+
+-- Возвращает id напоминаний, захваченных этим вызовом; p_note_ids - id
+-- заметок (серий) этих напоминаний, напоминания удаленных заметок не
+-- захватываются. Захваты старше двух дней удаляются: сработавшие
+-- напоминания с ними уже не совпадут
+drop function if exists claim_reminders(text, text[], date[]);
+
+create or replace function claim_reminders(p_owner text, p_ids text[], p_note_ids bigint[], p_dates date[])
+returns table (reminder_id text)
+language sql security definer set search_path = public as $$
+    delete from reminder_claims where note_date < current_date - 2;
+
+    insert into reminder_claims as c (reminder_id, note_date, owner)
+    select t.id, t.day, p_owner
+    from unnest(p_ids, p_note_ids, p_dates) as t(id, note_id, day)
+    where exists (select 1 from notes n where n.id = t.note_id)
+    on conflict do nothing
+    returning c.reminder_id;
+$$;
+
+-- По умолчанию execute на функции есть у public, а через него у anon и
+-- authenticated: без revoke любой владелец ключа index.html читал бы заметки
+-- всех семей и перехватывал чужие напоминания
+revoke execute on function reminder_notes(date, date, boolean, bigint, int[], int, int) from public, anon, authenticated;
+revoke execute on function acquire_reminder_leases(text, int[], int) from public, anon, authenticated;
+revoke execute on function release_reminder_leases(text) from public, anon, authenticated;
+revoke execute on function claim_reminders(text, text[], bigint[], date[]) from public, anon, authenticated;
+
+grant execute on function reminder_notes(date, date, boolean, bigint, int[], int, int) to service_role;
+grant execute on function acquire_reminder_leases(text, int[], int) to service_role;
+grant execute on function release_reminder_leases(text) to service_role;
+grant execute on function claim_reminders(text, text[], bigint[], date[]) to service_role;